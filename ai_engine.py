@@ -0,0 +1,585 @@
+import os
+import asyncio
+import queue
+import threading
+import time
+import concurrent.futures
+from contextlib import contextmanager
+import anthropic
+from typing import Dict, Iterator, List
+from dotenv import load_dotenv
+from ai_service import AIWritingAssistant, ai_assistant
+from suggestion_cache import SQLiteCacheBackend, SuggestionCache, suggestion_cache
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+load_dotenv()
+
+class EngineBusyError(Exception):
+    """Raised when a request could not get a slot in the pool before its deadline"""
+    pass
+
+class RequestCancelledError(Exception):
+    """Raised when a request was superseded by a newer one or aborted by the client"""
+    pass
+
+class RequestRegistry:
+    """
+    Tracks the in-flight AI request of each client channel (user + text + editor instance)
+
+    Registering a new request for a channel cancels the previous one, so a
+    fast typer never has more than one upstream call running per text and tab.
+    Entries live in this worker process only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}  # key -> (request_id, future)
+
+    def register(self, key, request_id, future):
+        """Make future the active request for key, cancelling whatever it supersedes"""
+        with self._lock:
+            previous = self._active.get(key)
+            self._active[key] = (request_id, future)
+
+        if previous and previous[1] is not future:
+            previous[1].cancel()
+
+    def unregister(self, key, future):
+        with self._lock:
+            active = self._active.get(key)
+            if active and active[1] is future:
+                del self._active[key]
+
+    def cancel(self, key, request_id=None) -> bool:
+        """
+        Cancel the active request for key
+
+        If request_id is given, only cancel when it matches the active
+        request, so a late abort cannot kill a newer request.
+        """
+        with self._lock:
+            active = self._active.get(key)
+            if not active or (request_id is not None and active[0] != request_id):
+                return False
+            del self._active[key]
+
+        return active[1].cancel()
+
+class FileFlightLock:
+    """
+    Cross-process single-flight lock backed by lock files in a local directory
+
+    Every key gets its own lock file, so unrelated prompts never wait on
+    each other. The holder deletes the file before releasing it, which
+    keeps the directory from growing; a waiter that locked a file that was
+    deleted meanwhile notices the changed inode and tries again.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @contextmanager
+    def hold(self, key: str, timeout: float):
+        """
+        Wait up to timeout for the lock on key, yielding whether it was acquired
+
+        The key is used as the file name, so it must be file-system safe
+        (e.g. a hex digest).
+        """
+        path = os.path.join(self.directory, f"{key}.lock")
+        give_up_at = time.monotonic() + timeout
+        fd = None
+        try:
+            while True:
+                fd = os.open(path, os.O_CREAT | os.O_RDWR)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    if self._is_current(fd, path):
+                        break
+                    # Locked a file its holder had already deleted
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                except BlockingIOError:
+                    if time.monotonic() > give_up_at:
+                        os.close(fd)
+                        fd = None
+                        break
+                    time.sleep(0.05)
+                os.close(fd)
+                fd = None
+
+            yield fd is not None
+        finally:
+            if fd is not None:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+    def _is_current(self, fd: int, path: str) -> bool:
+        """Check that fd is still the file at path"""
+        try:
+            return os.fstat(fd).st_ino == os.stat(path).st_ino
+        except FileNotFoundError:
+            return False
+
+class _Flight:
+    """An upstream call shared by every request waiting on the same prompt"""
+
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+        self.closing = False
+
+    @property
+    def joinable(self) -> bool:
+        return not (self.closing or self.task.done())
+
+class _SharedStream:
+    """An upstream stream fanned out to every request subscribed to the same prompt"""
+
+    def __init__(self):
+        self.task = None
+        self.items = []
+        self.subscribers = []
+        self.closing = False
+        self.finished = False
+
+    @property
+    def joinable(self) -> bool:
+        return not (self.closing or self.finished or self.task.done())
+
+    def subscribe(self) -> queue.Queue:
+        """Create a subscriber queue, replaying what has already been streamed"""
+        results = queue.Queue()
+        for item in self.items:
+            results.put(item)
+        self.subscribers.append(results)
+        return results
+
+    def put(self, item):
+        self.items.append(item)
+        for results in self.subscribers:
+            results.put(item)
+
+    def finish(self, sentinel):
+        self.finished = True
+        for results in self.subscribers:
+            results.put(sentinel)
+
+class _StreamSubscription:
+    """Handle that lets the request registry cancel one subscriber of a shared stream"""
+
+    def __init__(self, engine: "SuggestionEngine", key: str, results: queue.Queue):
+        self.engine = engine
+        self.key = key
+        self.results = results
+        self._cancelled = False
+
+    def cancel(self) -> bool:
+        if self._cancelled:
+            return False
+        self._cancelled = True
+
+        self.results.put(self.engine._CANCELLED)
+        self.engine._loop.call_soon_threadsafe(self.engine._leave_stream, self.key, self.results)
+        return True
+
+class SuggestionEngine:
+    """
+    Asyncio-based suggestion engine shared by all request threads of a worker
+
+    A single event loop runs in a background thread and owns an AsyncAnthropic
+    client. Flask routes submit work to it and wait on the result, so a slow
+    LLM call only parks a lightweight request thread instead of a whole
+    worker. A semaphore caps how many upstream calls are in flight at once;
+    requests beyond the cap queue until their deadline and then fail fast.
+    Results are served from the suggestion cache when the same prompt
+    inputs were answered recently. Callers that pass a request_key get
+    their previous in-flight request for that key cancelled.
+
+    Identical prompts that are in flight at the same time share a single
+    upstream call (single-flight). Within a worker this happens on the
+    event loop; across workers it needs a flight_lock plus a shared cache
+    backend, so followers wait for the leader and read its answer from
+    the cache.
+    """
+
+    _DONE = object()
+    _FAILED = object()
+    _CANCELLED = object()
+
+    def __init__(self, assistant: AIWritingAssistant, cache: SuggestionCache, max_concurrency: int = 16,
+                 queue_timeout: float = 10.0, request_timeout: float = 30.0, flight_lock=None,
+                 usage_log_every: int = 100):
+        self.assistant = assistant
+        self.cache = cache
+        self.flight_lock = flight_lock
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.usage_log_every = usage_log_every
+        self.registry = RequestRegistry()
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._client = None
+        self._semaphore = None
+
+        # In-flight upstream calls by cache key; only touched on the event loop
+        self._calls = {}
+        self._streams = {}
+
+    def get_suggestions(self, title: str, current_text: str, document_context: str = "",
+                        request_key=None, request_id=None, refund=None) -> List[Dict]:
+        """
+        Generate suggestions through the shared pool, blocking the calling thread only
+
+        Args:
+            title: The writing title/topic
+            current_text: Current text being written
+            document_context: Optional context from uploaded documents
+            request_key: Optional client channel; a newer request on it cancels this one
+            request_id: Optional client-side id, used to match explicit aborts
+            refund: Optional callable, called in this thread unless the answer came
+                from an upstream call this request started (e.g. to give back quota)
+
+        Returns:
+            List of suggestion dictionaries
+
+        Raises:
+            RequestCancelledError: If the request was superseded or aborted
+        """
+        charged = False
+        try:
+            cache_key = self.cache.make_key(title, current_text, document_context)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            with self._flight_lock(cache_key):
+                # Double-checked: a worker that held the lock before us may have answered meanwhile
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
+                deadline = time.monotonic() + self.queue_timeout
+                future = self._submit(self._shared_call(cache_key, title, current_text, document_context, deadline))
+                if request_key is not None:
+                    self.registry.register(request_key, request_id, future)
+
+                try:
+                    suggestions, charged = future.result(timeout=self.queue_timeout + self.request_timeout)
+                    self.cache.set(cache_key, suggestions)
+                    return suggestions
+                except concurrent.futures.CancelledError:
+                    raise RequestCancelledError()
+                except EngineBusyError:
+                    print("AI engine busy: request expired while waiting for a free slot")
+                    return [self._busy_suggestion()]
+                except concurrent.futures.TimeoutError:
+                    future.cancel()
+                    print("AI engine timeout: upstream request took too long")
+                    return [self.assistant._error_suggestion()]
+                except Exception as e:
+                    print(f"Error getting AI suggestions: {str(e)}")
+                    return [self.assistant._error_suggestion()]
+                finally:
+                    if request_key is not None:
+                        self.registry.unregister(request_key, future)
+        finally:
+            if refund is not None and not charged:
+                refund()
+
+    def stream_suggestions(self, title: str, current_text: str, document_context: str = "",
+                           request_key=None, request_id=None, refund=None) -> Iterator[Dict]:
+        """
+        Stream suggestions through the shared pool as soon as each one is parsed
+
+        Closing the generator (e.g. when the client disconnects) cancels the
+        upstream call and frees its slot, unless other requests are still
+        subscribed to it. Raises RequestCancelledError once the request is
+        superseded or aborted. refund is called as in get_suggestions, so a
+        stream that fails, is cancelled or was shared is not charged.
+        """
+        charged = False
+        try:
+            cache_key = self.cache.make_key(title, current_text, document_context)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                for suggestion in cached:
+                    yield suggestion
+                return
+
+            with self._flight_lock(cache_key):
+                # Double-checked: a worker that held the lock before us may have answered meanwhile
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    for suggestion in cached:
+                        yield suggestion
+                    return
+
+                deadline = time.monotonic() + self.queue_timeout
+                results, started = self._submit(
+                    self._join_stream(cache_key, title, current_text, document_context, deadline)
+                ).result()
+                subscription = _StreamSubscription(self, cache_key, results)
+                if request_key is not None:
+                    self.registry.register(request_key, request_id, subscription)
+                streamed = []
+
+                try:
+                    while True:
+                        try:
+                            item = results.get(timeout=self.queue_timeout + self.request_timeout)
+                        except queue.Empty:
+                            print("AI engine timeout: upstream stream stalled")
+                            yield self.assistant._error_suggestion()
+                            return
+
+                        if item is self._CANCELLED:
+                            raise RequestCancelledError()
+                        if item is self._FAILED:
+                            # Whatever was streamed (and the error, if nothing was) is not the full answer
+                            return
+                        if item is self._DONE:
+                            # Only a stream that ran to completion is worth caching
+                            self.cache.set(cache_key, streamed)
+                            charged = started
+                            return
+                        streamed.append(item)
+                        yield item
+                finally:
+                    subscription.cancel()
+                    if request_key is not None:
+                        self.registry.unregister(request_key, subscription)
+        finally:
+            if refund is not None and not charged:
+                refund()
+
+    def abort(self, request_key, request_id=None) -> bool:
+        """Cancel the in-flight request for a client channel, returning True if one was cancelled"""
+        return self.registry.cancel(request_key, request_id)
+
+    def stats(self) -> Dict:
+        """Get cache and token usage counters for this process"""
+        return {
+            'cache': self.cache.stats(),
+            'usage': self.assistant.usage_stats()
+        }
+
+    def _record_usage(self, usage):
+        """Count token usage, logging this worker's stats every usage_log_every requests"""
+        self.assistant._record_usage(usage)
+        if usage is None or not self.usage_log_every:
+            return
+
+        stats = self.stats()
+        if stats['usage']['requests'] % self.usage_log_every == 0:
+            print(f"AI engine stats: {stats}")
+
+    def _submit(self, coroutine) -> concurrent.futures.Future:
+        """Schedule a coroutine on the engine's event loop from any thread"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the background event loop on first use (and again in forked workers)"""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='ai-engine', daemon=True)
+                thread.start()
+
+                # Loop-bound primitives must be created on the loop itself
+                asyncio.run_coroutine_threadsafe(self._setup(), loop).result()
+
+                self._loop = loop
+                self._pid = os.getpid()
+            return self._loop
+
+    async def _setup(self):
+        self._client = anthropic.AsyncAnthropic(
+            api_key=os.getenv('ANTHROPIC_API_KEY'),
+            timeout=self.request_timeout
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _acquire_slot(self, deadline: float):
+        """Wait for a free slot in the pool, giving up once the request's deadline passes"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise EngineBusyError()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=remaining)
+        except asyncio.TimeoutError:
+            raise EngineBusyError()
+
+    async def _shared_call(self, key: str, title: str, current_text: str, document_context: str,
+                           deadline: float) -> List[Dict]:
+        """
+        Await the upstream call for key, starting one only if none is in flight
+
+        Returns:
+            Tuple of (suggestions, whether this request started the call)
+        """
+        flight = self._calls.get(key)
+        started = flight is None or not flight.joinable
+        if started:
+            flight = _Flight(asyncio.ensure_future(self._generate(title, current_text, document_context, deadline)))
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda task: self._forget(self._calls, key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), started
+        finally:
+            flight.waiters -= 1
+            # Nobody is waiting for the answer any more - stop paying for it
+            if not flight.waiters and not flight.task.done():
+                flight.closing = True
+                flight.task.cancel()
+
+    async def _join_stream(self, key: str, title: str, current_text: str, document_context: str,
+                           deadline: float) -> queue.Queue:
+        """
+        Subscribe to the upstream stream for key, starting one only if none is in flight
+
+        Returns:
+            Tuple of (subscriber queue, whether this request started the stream)
+        """
+        flight = self._streams.get(key)
+        started = flight is None or not flight.joinable
+        if started:
+            flight = _SharedStream()
+            flight.task = asyncio.ensure_future(self._stream(title, current_text, document_context, deadline, flight))
+            self._streams[key] = flight
+            flight.task.add_done_callback(lambda task: self._forget(self._streams, key, flight))
+
+        return flight.subscribe(), started
+
+    def _leave_stream(self, key: str, results: queue.Queue):
+        """Unsubscribe from a shared stream (runs on the loop), cancelling it once nobody listens"""
+        flight = self._streams.get(key)
+        if flight is None or results not in flight.subscribers:
+            return
+
+        flight.subscribers.remove(results)
+        if not flight.subscribers and not flight.task.done():
+            flight.closing = True
+            flight.task.cancel()
+
+    def _forget(self, flights: Dict, key: str, flight):
+        if flights.get(key) is flight:
+            del flights[key]
+
+    @contextmanager
+    def _flight_lock(self, key: str):
+        """
+        Hold the cross-worker lock for key while generating its answer
+
+        Yields whether the lock was acquired. Once the wait times out the
+        caller goes ahead without it, so a stuck worker cannot block others.
+        """
+        if self.flight_lock is None:
+            yield True
+            return
+
+        with self.flight_lock.hold(key, timeout=self.queue_timeout + self.request_timeout) as acquired:
+            yield acquired
+
+    async def _generate(self, title: str, current_text: str, document_context: str, deadline: float) -> List[Dict]:
+        await self._acquire_slot(deadline)
+        try:
+            response = await self._client.messages.create(
+                **self.assistant._request_params(title, current_text, document_context)
+            )
+            self._record_usage(response.usage)
+            return self.assistant._parse_suggestions(response.content[0].text)
+        finally:
+            self._semaphore.release()
+
+    async def _stream(self, title: str, current_text: str, document_context: str, deadline: float,
+                      results: "_SharedStream"):
+        count = 0
+        end = self._FAILED  # Only a clean end of the stream is sent as _DONE
+        try:
+            await self._acquire_slot(deadline)
+            try:
+                params = self.assistant._request_params(title, current_text, document_context)
+
+                async with self._client.messages.stream(**params) as stream:
+                    try:
+                        buffer = ""
+                        async for chunk in stream.text_stream:
+                            suggestions, buffer = self.assistant._consume_lines(buffer + chunk)
+                            for suggestion in suggestions:
+                                results.put(suggestion)
+                                count += 1
+                                if count >= 3:
+                                    end = self._DONE
+                                    return
+
+                        # The last line has no trailing newline
+                        suggestion = self.assistant._parse_suggestion_line(buffer)
+                        if suggestion:
+                            results.put(suggestion)
+                            count += 1
+                    finally:
+                        self._record_usage(self.assistant._stream_usage(stream))
+            finally:
+                self._semaphore.release()
+
+            # Ensure we always return at least one suggestion
+            if not count:
+                results.put(self.assistant._fallback_suggestion())
+            end = self._DONE
+
+        except EngineBusyError:
+            print("AI engine busy: request expired while waiting for a free slot")
+            results.put(self._busy_suggestion())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error streaming AI suggestions: {str(e)}")
+            if not count:
+                results.put(self.assistant._error_suggestion())
+        finally:
+            results.finish(end)
+
+    def _busy_suggestion(self) -> Dict:
+        return {
+            "type": "error",
+            "text": "The AI assistant is busy right now. Please try again in a moment."
+        }
+
+def create_flight_lock():
+    """Create the cross-worker single-flight lock if AI_SINGLEFLIGHT_LOCK_DIR is set"""
+    directory = os.getenv('AI_SINGLEFLIGHT_LOCK_DIR')
+    if not directory:
+        return None
+
+    if fcntl is None:
+        print("⚠️ AI_SINGLEFLIGHT_LOCK_DIR is set but file locks are not supported on this platform")
+        return None
+    if not isinstance(suggestion_cache.backend, SQLiteCacheBackend):
+        print("⚠️ Cross-worker single-flight needs AI_CACHE_BACKEND=sqlite to share results between workers")
+
+    return FileFlightLock(directory)
+
+# Global instance
+suggestion_engine = SuggestionEngine(
+    ai_assistant,
+    suggestion_cache,
+    max_concurrency=int(os.getenv('AI_MAX_CONCURRENCY', '16')),
+    queue_timeout=float(os.getenv('AI_QUEUE_TIMEOUT', '10')),
+    request_timeout=float(os.getenv('AI_REQUEST_TIMEOUT', '30')),
+    flight_lock=create_flight_lock(),
+    usage_log_every=int(os.getenv('AI_USAGE_LOG_EVERY', '100'))
+)
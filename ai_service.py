@@ -1,15 +1,46 @@
 import os
+import threading
 import anthropic
-from typing import List, Dict, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
 
+SYSTEM_PROMPT = """You are a helpful writing assistant. Help the user continue their writing.
+
+The user will give you the title/topic of their writing, their current text and, optionally, reference context from documents they uploaded. Provide 3 helpful writing suggestions. Each suggestion should be one of these types:
+1. CONTINUATION - How to continue writing the next sentence/paragraph using information from the documents
+2. IMPROVEMENT - How to improve existing text by incorporating relevant details from the reference context
+3. STRUCTURE - Suggestions about organization or flow that align with the document structure
+
+IMPORTANT: Prioritize using specific information, facts, or insights from the Reference Context when making suggestions. Reference the documents when relevant.
+
+Format your response as:
+1. [TYPE]: Suggestion text here
+2. [TYPE]: Suggestion text here  
+3. [TYPE]: Suggestion text here
+
+Keep suggestions concise and actionable."""
+
+# Longest document context sent with a request, in characters
+CONTEXT_MAX_CHARS = int(os.getenv('AI_CONTEXT_MAX_CHARS', '5000'))
+
+# Claude 3 Haiku does not cache prompt prefixes shorter than this
+PROMPT_CACHE_MIN_TOKENS = 2048
+
 class AIWritingAssistant:
     def __init__(self):
         self.client = anthropic.Anthropic(
             api_key=os.getenv('ANTHROPIC_API_KEY')
         )
+        self._usage_lock = threading.Lock()
+        self._usage = {
+            'requests': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cache_creation_input_tokens': 0,
+            'cache_read_input_tokens': 0
+        }
     
     def get_suggestions(self, title: str, current_text: str, document_context: str = "") -> List[Dict]:
         """
@@ -24,21 +55,9 @@ class AIWritingAssistant:
             List of suggestion dictionaries
         """
         try:
-            # Build the prompt
-            prompt = self._build_prompt(title, current_text, document_context)
-            
             # Call Claude API
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=1000,
-                temperature=0.7,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ]
-            )
+            response = self.client.messages.create(**self._request_params(title, current_text, document_context))
+            self._record_usage(response.usage)
             
             # Parse response into suggestions
             suggestions = self._parse_suggestions(response.content[0].text)
@@ -46,49 +65,147 @@ class AIWritingAssistant:
             
         except Exception as e:
             print(f"Error getting AI suggestions: {str(e)}")
-            return [
+            return [self._error_suggestion()]
+    
+    def stream_suggestions(self, title: str, current_text: str, document_context: str = "") -> Iterator[Dict]:
+        """
+        Stream AI writing suggestions as soon as each one is complete
+        
+        Uses the Anthropic streaming API and parses "N. [TYPE]: ..." lines as
+        they arrive, so the first suggestion can be shown before the model has
+        finished writing the others.
+        
+        Args:
+            title: The writing title/topic
+            current_text: Current text being written
+            document_context: Optional context from uploaded documents
+            
+        Yields:
+            Suggestion dictionaries, at most 3
+        """
+        count = 0
+        try:
+            with self.client.messages.stream(**self._request_params(title, current_text, document_context)) as stream:
+                try:
+                    for suggestion in self._iter_suggestions(stream.text_stream):
+                        yield suggestion
+                        count += 1
+                        if count >= 3:
+                            return
+                finally:
+                    self._record_usage(self._stream_usage(stream))
+            
+        except Exception as e:
+            print(f"Error streaming AI suggestions: {str(e)}")
+            if not count:
+                yield self._error_suggestion()
+            return
+        
+        # Ensure we always return at least one suggestion
+        if not count:
+            yield self._fallback_suggestion()
+    
+    def _request_params(self, title: str, current_text: str, document_context: str = "") -> Dict:
+        """Build the keyword arguments shared by blocking and streaming calls"""
+        return {
+            "model": "claude-3-haiku-20240307",
+            "max_tokens": 1000,
+            "temperature": 0.7,
+            "system": self._build_system(document_context),
+            "messages": [
                 {
-                    "type": "error",
-                    "text": "Unable to generate suggestions at the moment. Please try again."
+                    "role": "user",
+                    "content": self._build_user_content(title, current_text)
                 }
             ]
+        }
     
-    def _build_prompt(self, title: str, current_text: str, document_context: str = "") -> str:
-        """Build the prompt for Claude API"""
+    def _iter_suggestions(self, chunks: Iterable[str]) -> Iterator[Dict]:
+        """Parse suggestions out of a stream of text chunks, one complete line at a time"""
+        buffer = ""
+        for chunk in chunks:
+            suggestions, buffer = self._consume_lines(buffer + chunk)
+            for suggestion in suggestions:
+                yield suggestion
         
-        prompt = f"""You are a helpful writing assistant. Help the user continue their writing.
-
-Title/Topic: "{title}"
-
-"""
+        # The last line has no trailing newline
+        suggestion = self._parse_suggestion_line(buffer)
+        if suggestion:
+            yield suggestion
+    
+    def _consume_lines(self, buffer: str) -> Tuple[List[Dict], str]:
+        """Parse every complete line in buffer, returning the suggestions and the unfinished remainder"""
+        suggestions = []
+        while '\n' in buffer:
+            line, buffer = buffer.split('\n', 1)
+            suggestion = self._parse_suggestion_line(line)
+            if suggestion:
+                suggestions.append(suggestion)
+        return suggestions, buffer
+    
+    def _build_system(self, document_context: str = "") -> List[Dict]:
+        """
+        Build the stable prompt prefix: instructions, then the document context
+        
+        Both only change when documents are associated with the text, so
+        keystroke-debounced calls for the same text share this prefix. It
+        gets a cache breakpoint only when it is long enough for Anthropic's
+        prompt cache; shorter prefixes would never be cached.
+        """
+        system = [{"type": "text", "text": SYSTEM_PROMPT}]
         
         if document_context:
-            # Use enhanced context - up to 5000 characters optimized for better AI suggestions
-            context_limit = 5000
-            if len(document_context) > context_limit:
-                truncated_context = document_context[:context_limit] + "..."
-            else:
-                truncated_context = document_context
-            prompt += f"Reference Context (from uploaded documents - USE THIS INFORMATION):\n{truncated_context}\n\n"
+            if len(document_context) > CONTEXT_MAX_CHARS:
+                document_context = document_context[:CONTEXT_MAX_CHARS] + "..."
+            system.append({
+                "type": "text",
+                "text": f"Reference Context (from uploaded documents - USE THIS INFORMATION):\n{document_context}"
+            })
         
-        prompt += f"""Current Text:
-{current_text}
-
-Please provide 3 helpful writing suggestions based on the reference context above. Each suggestion should be one of these types:
-1. CONTINUATION - How to continue writing the next sentence/paragraph using information from the documents
-2. IMPROVEMENT - How to improve existing text by incorporating relevant details from the reference context
-3. STRUCTURE - Suggestions about organization or flow that align with the document structure
-
-IMPORTANT: Prioritize using specific information, facts, or insights from the Reference Context when making suggestions. Reference the documents when relevant.
-
-Format your response as:
-1. [TYPE]: Suggestion text here
-2. [TYPE]: Suggestion text here  
-3. [TYPE]: Suggestion text here
+        if self._estimate_tokens(''.join(block["text"] for block in system)) >= PROMPT_CACHE_MIN_TOKENS:
+            system[-1]["cache_control"] = {"type": "ephemeral"}
+        
+        return system
+    
+    def _build_user_content(self, title: str, current_text: str) -> List[Dict]:
+        """Build the user message with the text being written"""
+        return [
+            {
+                "type": "text",
+                "text": f"""Title/Topic: "{title}"
 
-Keep suggestions concise and actionable."""
+Current Text:
+{current_text}
 
-        return prompt
+Please provide 3 helpful writing suggestions based on the reference context above."""
+            }
+        ]
+    
+    def _estimate_tokens(self, text: str) -> int:
+        """Rough token count (about 4 characters per token for English text)"""
+        return len(text) // 4
+    
+    def _record_usage(self, usage) -> None:
+        """Accumulate token usage, including prompt cache reads and writes"""
+        if usage is None:
+            return
+        
+        with self._usage_lock:
+            self._usage['requests'] += 1
+            for field in ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens'):
+                self._usage[field] += getattr(usage, field, None) or 0
+    
+    def _stream_usage(self, stream):
+        """Usage of a (possibly partial) streamed message, or None if nothing was received"""
+        try:
+            return stream.current_message_snapshot.usage
+        except Exception:
+            return None
+    
+    def usage_stats(self) -> Dict:
+        """Get token usage counters for this process"""
+        with self._usage_lock:
+            return dict(self._usage)
     
     def _parse_suggestions(self, response_text: str) -> List[Dict]:
         """Parse Claude's response into structured suggestions"""
@@ -96,36 +213,53 @@ Keep suggestions concise and actionable."""
         lines = response_text.strip().split('\n')
         
         for line in lines:
-            line = line.strip()
-            if line and (line.startswith('1.') or line.startswith('2.') or line.startswith('3.')):
-                # Extract type and text
-                if '[CONTINUATION]' in line:
-                    suggestion_type = 'continuation'
-                    text = line.split('[CONTINUATION]:')[1].strip()
-                elif '[IMPROVEMENT]' in line:
-                    suggestion_type = 'improvement'
-                    text = line.split('[IMPROVEMENT]:')[1].strip()
-                elif '[STRUCTURE]' in line:
-                    suggestion_type = 'structure'
-                    text = line.split('[STRUCTURE]:')[1].strip()
-                else:
-                    # Fallback - extract text after number
-                    suggestion_type = 'general'
-                    text = line.split('.', 1)[1].strip() if '.' in line else line
-                
-                suggestions.append({
-                    'type': suggestion_type,
-                    'text': text
-                })
+            suggestion = self._parse_suggestion_line(line)
+            if suggestion:
+                suggestions.append(suggestion)
         
         # Ensure we always return at least one suggestion
         if not suggestions:
-            suggestions.append({
-                'type': 'general',
-                'text': 'Continue writing by expanding on your current ideas.'
-            })
+            suggestions.append(self._fallback_suggestion())
         
         return suggestions[:3]  # Limit to 3 suggestions
+    
+    def _parse_suggestion_line(self, line: str) -> Optional[Dict]:
+        """Parse a single "N. [TYPE]: text" line, or return None if it is not a suggestion"""
+        line = line.strip()
+        if not (line and (line.startswith('1.') or line.startswith('2.') or line.startswith('3.'))):
+            return None
+        
+        # Extract type and text
+        if '[CONTINUATION]' in line:
+            suggestion_type = 'continuation'
+            text = line.split('[CONTINUATION]:')[1].strip()
+        elif '[IMPROVEMENT]' in line:
+            suggestion_type = 'improvement'
+            text = line.split('[IMPROVEMENT]:')[1].strip()
+        elif '[STRUCTURE]' in line:
+            suggestion_type = 'structure'
+            text = line.split('[STRUCTURE]:')[1].strip()
+        else:
+            # Fallback - extract text after number
+            suggestion_type = 'general'
+            text = line.split('.', 1)[1].strip() if '.' in line else line
+        
+        return {
+            'type': suggestion_type,
+            'text': text
+        }
+    
+    def _fallback_suggestion(self) -> Dict:
+        return {
+            'type': 'general',
+            'text': 'Continue writing by expanding on your current ideas.'
+        }
+    
+    def _error_suggestion(self) -> Dict:
+        return {
+            "type": "error",
+            "text": "Unable to generate suggestions at the moment. Please try again."
+        }
 
 # Global instance
 ai_assistant = AIWritingAssistant()
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
-from flask import Flask, render_template
+from tempfile import SpooledTemporaryFile
+from flask import Flask, Request, render_template
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_mail import Mail
@@ -10,10 +11,23 @@ from billing_routes import billing_bp
 from utils import mail
 from config import Config
 from subscription_middleware import init_subscription_middleware
+from upload_pipeline import upload_pipeline
+from document_processor import document_processor
+from identity_cache import identity_cache
+
+class UploadRequest(Request):
+    """Request that parses uploads up to the in-memory threshold without spooling them to disk"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if document_processor.memory_threshold <= 0:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        # Rolls over to a temporary file only past the threshold
+        return SpooledTemporaryFile(max_size=document_processor.memory_threshold, mode='rb+')
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.request_class = UploadRequest
     
     # Initialize extensions
     db.init_app(app)
@@ -110,7 +124,8 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # One query (or none, from a recent snapshot) for the user and its active subscription
+        return identity_cache.load_user(int(user_id))
 
     # Initialize Flask-Migrate
     migrate = Migrate(app, db)
@@ -118,6 +133,9 @@ def create_app():
     # Initialize subscription middleware
     init_subscription_middleware(app)
     
+    # Start the background upload pipeline in each serving process
+    upload_pipeline.init_app(app)
+    
     # Make app config available in templates
     @app.context_processor
     def inject_config():
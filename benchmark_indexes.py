@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Query-plan benchmark for the per-user indexes added in migration 010
+Seeds a scratch schema with many users, then EXPLAIN ANALYZEs the app's hot per-user
+queries before and after creating the indexes
+
+Usage: python benchmark_indexes.py [--users N] [--texts-per-user N] [--documents-per-user N]
+Runs against DATABASE_URL inside its own schema, which is dropped afterwards.
+Point it at a development database, not production.
+"""
+
+import os
+import json
+import random
+import argparse
+import psycopg2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SCHEMA = 'writify_index_benchmark'
+
+# Trimmed copies of the real tables: only the columns the benchmarked queries touch
+SCHEMA_SQL = """
+CREATE TABLE users (
+    id SERIAL PRIMARY KEY,
+    email VARCHAR(120) NOT NULL,
+    stripe_customer_id VARCHAR(100)
+);
+CREATE TABLE texts (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    title VARCHAR(255) NOT NULL,
+    content TEXT,
+    created_at TIMESTAMP,
+    updated_at TIMESTAMP
+);
+CREATE TABLE documents (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    original_filename VARCHAR(255) NOT NULL,
+    file_type VARCHAR(10) NOT NULL,
+    file_size INTEGER NOT NULL,
+    created_at TIMESTAMP
+);
+CREATE TABLE text_documents (
+    text_id INTEGER NOT NULL REFERENCES texts (id),
+    document_id INTEGER NOT NULL REFERENCES documents (id),
+    created_at TIMESTAMP,
+    PRIMARY KEY (text_id, document_id)
+);
+CREATE TABLE subscriptions (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users (id),
+    status VARCHAR(20) NOT NULL,
+    created_at TIMESTAMP
+);
+"""
+
+SEED_SQL = """
+INSERT INTO users (email, stripe_customer_id)
+SELECT 'user' || n || '@example.com', CASE WHEN n %% 3 = 0 THEN 'cus_' || n END
+FROM generate_series(1, %(users)s) AS n;
+
+INSERT INTO texts (user_id, title, content, created_at, updated_at)
+SELECT u, 'Draft ' || t, repeat('Lorem ipsum dolor sit amet. ', 40),
+       now() - (random() * interval '365 days'), now() - (random() * interval '365 days')
+FROM generate_series(1, %(users)s) AS u, generate_series(1, %(texts)s) AS t;
+
+INSERT INTO documents (user_id, original_filename, file_type, file_size, created_at)
+SELECT u, 'source_' || d || '.pdf', 'pdf', 100000 + d, now() - (random() * interval '365 days')
+FROM generate_series(1, %(users)s) AS u, generate_series(1, %(documents)s) AS d;
+
+INSERT INTO text_documents (text_id, document_id, created_at)
+SELECT t.id, d.id, now()
+FROM texts t
+JOIN documents d ON d.user_id = t.user_id AND d.id %% %(documents)s = t.id %% %(documents)s;
+
+INSERT INTO subscriptions (user_id, status, created_at)
+SELECT u, CASE WHEN u %% 4 = 0 THEN 'active' ELSE 'canceled' END, now()
+FROM generate_series(1, %(users)s) AS u, generate_series(1, 3) AS s;
+"""
+
+VACUUM_SQL = "VACUUM ANALYZE users, texts, documents, text_documents, subscriptions"
+
+# Same definitions as migration 010
+INDEX_SQL = """
+CREATE INDEX idx_texts_user_updated ON texts (user_id, updated_at DESC, id DESC);
+CREATE INDEX idx_documents_user_created ON documents (user_id, created_at DESC, id DESC)
+    INCLUDE (original_filename, file_type, file_size);
+CREATE INDEX idx_subscriptions_user_active ON subscriptions (user_id) WHERE status = 'active';
+CREATE INDEX idx_text_documents_document_id ON text_documents (document_id);
+CREATE INDEX ix_users_stripe_customer_id ON users (stripe_customer_id);
+"""
+
+# Queries issued by main.py, models.py and stripe_service.py, with a %(user_id)s / %(document_id)s parameter
+QUERIES = {
+    'dashboard texts': "SELECT id, title, updated_at FROM texts WHERE user_id = %(user_id)s ORDER BY updated_at DESC",
+    'texts page (keyset)': "SELECT id, title, updated_at FROM texts WHERE user_id = %(user_id)s "
+                           "ORDER BY updated_at DESC, id DESC LIMIT 20",
+    'user documents': "SELECT id, original_filename, file_type, file_size FROM documents "
+                      "WHERE user_id = %(user_id)s ORDER BY created_at DESC, id DESC",
+    'active subscription': "SELECT id FROM subscriptions WHERE user_id = %(user_id)s AND status = 'active' LIMIT 1",
+    'texts using a document': "SELECT text_id FROM text_documents WHERE document_id = %(document_id)s",
+    'user by stripe customer': "SELECT id FROM users WHERE stripe_customer_id = 'cus_' || (%(user_id)s * 3)"
+}
+
+def get_database_url():
+    database_url = os.environ.get('DATABASE_URL', '').strip() or 'postgresql://localhost/writify_db'
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+    return database_url
+
+def measure(cursor, sql: str, samples: list) -> tuple:
+    """Average execution time (ms) over the samples, and the top plan node of the last one"""
+    total = 0.0
+    plan = None
+    for params in samples:
+        cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+        result = cursor.fetchone()[0]
+        result = result if isinstance(result, list) else json.loads(result)
+        total += result[0]['Execution Time']
+        plan = result[0]['Plan']
+    return total / len(samples), describe_plan(plan)
+
+def describe_plan(plan: dict) -> str:
+    """Name the scan doing the work, e.g. 'Index Only Scan using idx_...' or 'Seq Scan'"""
+    while plan.get('Plans') and ('Scan' not in plan['Node Type'] or plan['Node Type'] == 'Bitmap Heap Scan'):
+        plan = plan['Plans'][0]
+    if plan.get('Index Name'):
+        return f"{plan['Node Type']} using {plan['Index Name']}"
+    return plan['Node Type']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--texts-per-user', type=int, default=30)
+    parser.add_argument('--documents-per-user', type=int, default=10)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(get_database_url())
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    try:
+        print(f"🌱 Seeding {args.users} users with {args.texts_per_user} texts and "
+              f"{args.documents_per_user} documents each...")
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(f"SET search_path TO {SCHEMA}")
+        cursor.execute(SCHEMA_SQL)
+        cursor.execute(SEED_SQL, {
+            'users': args.users,
+            'texts': args.texts_per_user,
+            'documents': args.documents_per_user
+        })
+        cursor.execute(VACUUM_SQL)
+
+        cursor.execute("SELECT max(id) FROM documents")
+        max_document_id = cursor.fetchone()[0]
+        samples = [
+            {'user_id': random.randint(1, args.users), 'document_id': random.randint(1, max_document_id)}
+            for _ in range(args.samples)
+        ]
+
+        before = {name: measure(cursor, sql, samples) for name, sql in QUERIES.items()}
+
+        print("🔧 Creating indexes...")
+        cursor.execute(INDEX_SQL)
+        cursor.execute(VACUUM_SQL)
+
+        after = {name: measure(cursor, sql, samples) for name, sql in QUERIES.items()}
+
+        print(f"\n{'query':<26} {'before':>10} {'after':>10} {'speedup':>8}  plan after")
+        for name in QUERIES:
+            before_ms, _ = before[name]
+            after_ms, after_plan = after[name]
+            speedup = before_ms / after_ms if after_ms else float('inf')
+            print(f"{name:<26} {before_ms:>8.3f}ms {after_ms:>8.3f}ms {speedup:>7.1f}x  {after_plan}")
+        print("\nPlans before indexing:")
+        for name in QUERIES:
+            print(f"  {name:<26} {before[name][1]}")
+
+    finally:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark PDF text extraction: the original sequential loop against page-sharded extraction
+Generates synthetic 10, 100 and 1000-page PDFs and times each implementation on them
+
+Usage: python benchmark_pdf_extraction.py [--workers N] [--repeat N]
+"""
+
+import os
+import time
+import argparse
+import tempfile
+import PyPDF2
+from extraction import ExtractionPool, extract_pdf_text
+
+LINES_PER_PAGE = 40
+WORDS = ("research evidence writing analysis chapter method results discussion "
+         "context source argument thesis summary section figure table data").split()
+
+def build_synthetic_pdf(path: str, page_count: int):
+    """Write a minimal PDF with page_count pages of text in the base Helvetica font"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+
+    page_numbers = []
+    for page in range(page_count):
+        lines = []
+        for line in range(LINES_PER_PAGE):
+            words = [WORDS[(page * 7 + line * 3 + i) % len(WORDS)] for i in range(12)]
+            lines.append(f"Page {page + 1} line {line + 1}: " + " ".join(words))
+        stream = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({line}) '" for line in lines) + " ET"
+        stream = stream.encode('latin-1')
+
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_number = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_number
+        )
+        page_numbers.append(len(objects))
+
+    kids = b" ".join(b"%d 0 R" % number for number in page_numbers)
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, page_count)
+
+    with open(path, 'wb') as file:
+        file.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(file.tell())
+            file.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+
+        xref_offset = file.tell()
+        file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            file.write(b"%010d 00000 n \n" % offset)
+        file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset))
+
+def extract_sequential_original(file_path: str) -> str:
+    """The original implementation: one page after another, growing the string with +="""
+    text = ""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+
+        for page_num in range(len(pdf_reader.pages)):
+            page = pdf_reader.pages[page_num]
+            text += page.extract_text() + "\n"
+
+    return text.strip()
+
+def best_time(fn, repeat: int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def _warm_up():
+    return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--min-shard-pages', type=int, default=25)
+    args = parser.parse_args()
+
+    pool = ExtractionPool(max_workers=args.workers, timeout=600, memory_limit_mb=0,
+                          min_shard_pages=args.min_shard_pages)
+    pool.run(_warm_up)  # Start the worker processes outside the timings
+
+    print(f"Workers: {args.workers}, best of {args.repeat}")
+    print(f"{'pages':>6} {'original':>10} {'joined':>10} {'sharded':>10} {'speedup':>8}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for page_count in (10, 100, 1000):
+            path = os.path.join(directory, f"synthetic_{page_count}.pdf")
+            build_synthetic_pdf(path, page_count)
+
+            original_time, original_text = best_time(lambda: extract_sequential_original(path), args.repeat)
+            joined_time, joined_text = best_time(lambda: extract_pdf_text(path), args.repeat)
+            sharded_time, sharded_text = best_time(lambda: pool.extract('pdf', path), args.repeat)
+
+            assert joined_text == original_text, "joined extraction differs from the original"
+            assert sharded_text == original_text, "sharded extraction differs from the original"
+
+            print(f"{page_count:>6} {original_time:>9.3f}s {joined_time:>9.3f}s {sharded_time:>9.3f}s "
+                  f"{original_time / sharded_time:>7.2f}x")
+
+    pool.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from models import db, PaymentEvent
 from stripe_service import stripe_service
 from subscription_middleware import subscription_required
+from identity_cache import identity_cache
 
 billing_bp = Blueprint('billing', __name__)
 
@@ -190,6 +191,9 @@ def success():
     """Checkout success page"""
     session_id = request.args.get('session_id')
     
+    # The webhook may have been handled by another worker; read fresh status from now on
+    identity_cache.invalidate(current_user.id)
+    
     if session_id:
         try:
             # Retrieve the session to get details
@@ -226,11 +230,7 @@ def webhook():
         
         # Create event record
         if not existing_event:
-            payment_event = PaymentEvent(
-                stripe_event_id=event['id'],
-                event_type=event['type'],
-                data=event['data']
-            )
+            payment_event = stripe_service.build_payment_event(event, payload)
             db.session.add(payment_event)
         else:
             payment_event = existing_event
@@ -0,0 +1,152 @@
+from typing import Optional
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from models import db, Document, DocumentBlob, DocumentContent
+
+class BlobStore:
+    """
+    Content-hash deduplication of uploaded files and their extraction results
+
+    Every processed upload is recorded as a DocumentBlob keyed by the
+    SHA-256 of its bytes, holding the single stored copy (Cloudinary or
+    local) and a count of the documents referencing it. Uploading the same
+    bytes again, by any user, reuses the stored copy and the text already
+    extracted for a sibling document instead of parsing and storing the
+    file again. The stored file is deleted when its last reference goes.
+    """
+
+    def find_reusable(self, sha256: str) -> Optional[dict]:
+        """
+        Get the processing result of an already stored upload with the same content
+
+        Args:
+            sha256: Hex digest of the uploaded file
+
+        Returns:
+            Dictionary shaped like DocumentProcessor.process_saved_file's result
+            plus 'blob_id', with 'source_document_id', 'chunk_count' and
+            'token_count' of the sibling document in place of the extracted
+            text, or None if there is nothing to reuse. The sibling is locked
+            against deletion until the transaction ends, so its text and
+            chunks can be copied (ContentStore.copy, DocumentRetriever.copy_index).
+        """
+        row = db.session.execute(
+            select(
+                DocumentBlob,
+                Document.id.label('document_id'),
+                Document.context_head,
+                Document.context_tail,
+                Document.content_length,
+                Document.chunk_count,
+                Document.token_count
+            )
+            .join(Document, Document.blob_id == DocumentBlob.id)
+            .join(DocumentContent, DocumentContent.document_id == Document.id)
+            .where(
+                DocumentBlob.sha256 == sha256,
+                DocumentBlob.ref_count > 0,
+                Document.status == 'ready',
+                Document.chunk_count.isnot(None)
+            )
+            .limit(1)
+            .with_for_update(read=True, of=Document)
+        ).first()
+
+        if row is None:
+            return None
+
+        blob = row.DocumentBlob
+        return {
+            'success': True,
+            'blob_id': blob.id,
+            'file_path': blob.upload_path,
+            'source_document_id': row.document_id,
+            'chunk_count': row.chunk_count,
+            'token_count': row.token_count,
+            'context_digest': {
+                'context_head': row.context_head,
+                'context_tail': row.context_tail,
+                'content_length': row.content_length
+            },
+            'cloudinary_public_id': blob.cloudinary_public_id,
+            'cloudinary_url': blob.cloudinary_url,
+            'cloudinary_secure_url': blob.cloudinary_secure_url
+        }
+
+    def acquire(self, blob_id: int) -> bool:
+        """
+        Add a reference to an existing blob
+
+        Returns:
+            False if the blob lost its last reference (and its file) meanwhile
+        """
+        acquired = db.session.execute(
+            update(DocumentBlob)
+            .where(DocumentBlob.id == blob_id, DocumentBlob.ref_count > 0)
+            .values(ref_count=DocumentBlob.ref_count + 1)
+            .returning(DocumentBlob.id)
+        ).scalar()
+        return acquired is not None
+
+    def register(self, sha256: str, upload: dict, result: dict) -> Optional[int]:
+        """
+        Record a freshly processed upload as the blob for its content hash
+
+        Args:
+            sha256: Hex digest of the uploaded file
+            upload: Dictionary returned by DocumentProcessor.save_upload
+            result: Dictionary returned by DocumentProcessor.process_saved_file
+
+        Returns:
+            The new blob id, or None if a concurrent upload of the same content
+            registered first (the caller should then reuse that one)
+        """
+        return db.session.execute(
+            insert(DocumentBlob)
+            .values(
+                sha256=sha256,
+                file_type=upload['file_type'],
+                file_size=upload['file_size'],
+                upload_path=result.get('file_path'),
+                cloudinary_public_id=result.get('cloudinary_public_id'),
+                cloudinary_url=result.get('cloudinary_url'),
+                cloudinary_secure_url=result.get('cloudinary_secure_url'),
+                ref_count=1
+            )
+            .on_conflict_do_nothing(index_elements=['sha256'])
+            .returning(DocumentBlob.id)
+        ).scalar()
+
+    def release(self, document) -> bool:
+        """
+        Drop a document's reference to its blob
+
+        Args:
+            document: Document model instance about to be deleted
+
+        Returns:
+            True if the stored file is no longer referenced and should be deleted
+        """
+        blob_id = document.blob_id
+        if blob_id is None:
+            return True  # Not deduplicated: the document owns its file
+
+        remaining = db.session.execute(
+            update(DocumentBlob)
+            .where(DocumentBlob.id == blob_id)
+            .values(ref_count=DocumentBlob.ref_count - 1)
+            .returning(DocumentBlob.ref_count)
+        ).scalar()
+
+        # Detach first so the blob row can go (flushed before the DELETE below)
+        document.blob_id = None
+        if remaining is None or remaining > 0:
+            return False
+
+        db.session.execute(
+            delete(DocumentBlob).where(DocumentBlob.id == blob_id, DocumentBlob.ref_count <= 0)
+        )
+        return True
+
+# Global instance
+blob_store = BlobStore()
@@ -0,0 +1,140 @@
+import os
+import zlib
+from typing import Dict, List, Optional
+from datetime import datetime
+from sqlalchemy import select, insert, func, literal, literal_column
+from sqlalchemy.orm import aliased
+from dotenv import load_dotenv
+from models import db, Document, DocumentContent
+
+load_dotenv()
+
+# Same cap as the texts' generated vector: stay under PostgreSQL's 1 MB tsvector limit
+SEARCH_VECTOR_MAX_CHARS = 1000000
+
+class ContentStore:
+    """
+    Storage for the extracted text of documents
+
+    The text is kept out of the documents row, in document_contents, so
+    document listings and metadata queries never carry it. It is stored
+    as UTF-8 compressed with zlib (or uncompressed with compression='none');
+    each row records its codec, so changing the setting only affects new
+    rows. The document's full-text search vector is computed when the
+    text is saved, since PostgreSQL cannot generate it from compressed data.
+    """
+
+    CODECS = ('zlib', 'none')
+
+    def __init__(self, compression: str = 'zlib', level: int = 6):
+        if compression not in self.CODECS:
+            raise ValueError(f"Unsupported document compression: {compression}")
+        self.compression = compression
+        self.level = level
+
+    def encode(self, text: str) -> tuple:
+        """
+        Encode text for storage
+
+        Returns:
+            Tuple of (compression, data, original_size)
+        """
+        raw = text.encode('utf-8')
+        if self.compression == 'zlib':
+            return 'zlib', zlib.compress(raw, self.level), len(raw)
+        return 'none', raw, len(raw)
+
+    def decode(self, compression: str, data: bytes) -> str:
+        """Decode stored data back into text"""
+        if compression == 'zlib':
+            data = zlib.decompress(data)
+        elif compression != 'none':
+            raise ValueError(f"Unknown document compression: {compression}")
+        return bytes(data).decode('utf-8')
+
+    def save(self, document, text: str):
+        """
+        Store a document's extracted text and refresh its search vector (the caller commits)
+
+        Args:
+            document: Document model instance
+            text: Extracted text
+        """
+        compression, data, original_size = self.encode(text)
+        if document.content is None:
+            document.content = DocumentContent(compression=compression, data=data, original_size=original_size)
+        else:
+            document.content.compression = compression
+            document.content.data = data
+            document.content.original_size = original_size
+
+        document.search_vector = self.search_vector(document.original_filename, text)
+
+    def copy(self, document, source_document_id: int):
+        """
+        Give a document the stored text of another document with the same content (the caller commits)
+
+        The compressed text is copied inside the database, and the body part
+        of the source's search vector is reused under the document's own title.
+
+        Args:
+            document: Document model instance (must already have an id)
+            source_document_id: ID of the document whose text is copied
+        """
+        db.session.execute(
+            insert(DocumentContent).from_select(
+                ['document_id', 'compression', 'data', 'original_size', 'created_at'],
+                select(
+                    literal(document.id),
+                    DocumentContent.compression,
+                    DocumentContent.data,
+                    DocumentContent.original_size,
+                    literal(datetime.utcnow())
+                ).where(DocumentContent.document_id == source_document_id)
+            )
+        )
+
+        # Keep only the source's body lexemes (weight B), dropping its title
+        source = aliased(Document)
+        body_vector = select(
+            func.ts_filter(source.search_vector, literal_column("'{b}'"))
+        ).where(source.id == source_document_id).scalar_subquery()
+        title_vector = func.setweight(func.to_tsvector('english', document.original_filename or ''), 'A')
+        document.search_vector = title_vector.op('||')(func.coalesce(body_vector, func.to_tsvector('')))
+
+    def search_vector(self, title: str, text: str):
+        """SQL expression for a document's weighted search vector (title above body text)"""
+        title_vector = func.setweight(func.to_tsvector('english', title or ''), 'A')
+        body_vector = func.setweight(func.to_tsvector('english', (text or '')[:SEARCH_VECTOR_MAX_CHARS]), 'B')
+        return title_vector.op('||')(body_vector)
+
+    def load(self, document_id: int) -> Optional[str]:
+        """
+        Get the extracted text of one document
+
+        Returns:
+            The text, or None if the document has none stored
+        """
+        return self.load_many([document_id]).get(document_id)
+
+    def load_many(self, document_ids: List[int]) -> Dict[int, str]:
+        """
+        Get the extracted text of several documents in one query
+
+        Returns:
+            Dictionary of document id to text, for the documents that have text stored
+        """
+        if not document_ids:
+            return {}
+
+        rows = db.session.execute(
+            select(DocumentContent.document_id, DocumentContent.compression, DocumentContent.data)
+            .where(DocumentContent.document_id.in_(document_ids))
+        ).all()
+        return {row.document_id: self.decode(row.compression, row.data) for row in rows}
+
+# Global instance
+content_store = ContentStore(
+    compression=os.getenv('DOCUMENT_COMPRESSION', 'zlib'),
+    level=int(os.getenv('DOCUMENT_COMPRESSION_LEVEL', '6'))
+)
@@ -1,19 +1,27 @@
 import os
-import PyPDF2
-from docx import Document as DocxDocument
+import hashlib
 from typing import Optional
 import tempfile
 import uuid
 from werkzeug.utils import secure_filename
 import cloudinary
 import cloudinary.uploader
+from extraction import extraction_pool
+from content_store import content_store
 
 class DocumentProcessor:
     ALLOWED_EXTENSIONS = {'pdf', 'docx'}
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+    READ_CHUNK_SIZE = 64 * 1024
     
-    def __init__(self, upload_folder: str = 'uploads'):
+    # Context digest sizes: enough for the largest per-document share of the AI context
+    DIGEST_HEAD_CHARS = 4500
+    DIGEST_TAIL_CHARS = DIGEST_HEAD_CHARS // 2
+    
+    def __init__(self, upload_folder: str = 'uploads', memory_threshold: int = 0):
         self.upload_folder = upload_folder
+        # Uploads up to this size are processed from memory without touching the disk
+        self.memory_threshold = memory_threshold
         # Create upload folder if it doesn't exist (for temp files)
         os.makedirs(upload_folder, exist_ok=True)
         
@@ -45,32 +53,18 @@ class DocumentProcessor:
         return '.' in filename and \
                filename.rsplit('.', 1)[1].lower() in self.ALLOWED_EXTENSIONS
     
-    def extract_text_from_pdf(self, file_path: str) -> str:
-        """Extract text content from PDF file"""
+    def extract_text_from_pdf(self, source) -> str:
+        """Extract text content from a PDF file path or bytes (runs in the extraction pool)"""
         try:
-            text = ""
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                for page_num in range(len(pdf_reader.pages)):
-                    page = pdf_reader.pages[page_num]
-                    text += page.extract_text() + "\n"
-            
-            return text.strip()
+            return extraction_pool.extract('pdf', source)
         except Exception as e:
             print(f"Error extracting PDF text: {str(e)}")
             return ""
     
-    def extract_text_from_docx(self, file_path: str) -> str:
-        """Extract text content from DOCX file"""
+    def extract_text_from_docx(self, source) -> str:
+        """Extract text content from a DOCX file path or bytes (runs in the extraction pool)"""
         try:
-            doc = DocxDocument(file_path)
-            text = ""
-            
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            
-            return text.strip()
+            return extraction_pool.extract('docx', source)
         except Exception as e:
             print(f"Error extracting DOCX text: {str(e)}")
             return ""
@@ -86,6 +80,24 @@ class DocumentProcessor:
         Returns:
             Dictionary with file info, extracted text, and Cloudinary URLs
         """
+        upload = self.save_upload(file, user_id)
+        if 'error' in upload:
+            return upload
+        
+        return self.process_saved_file(upload)
+    
+    def save_upload(self, file, user_id: int) -> dict:
+        """
+        Validate an uploaded file and save it to a temporary file for processing
+        
+        Args:
+            file: Flask uploaded file object
+            user_id: ID of the user uploading the file
+            
+        Returns:
+            Dictionary with the unique filename, file info, sha256 and either
+            temp_path or the in-memory data, or an error
+        """
         if not file or file.filename == '':
             return {'error': 'No file selected'}
         
@@ -100,12 +112,7 @@ class DocumentProcessor:
         if file_size > self.MAX_FILE_SIZE:
             return {'error': 'File too large. Maximum size is 10MB.'}
         
-        temp_file_path = None
-        
         try:
-            # Configure Cloudinary
-            cloudinary_configured = self._configure_cloudinary()
-            
             # Secure filename
             filename = secure_filename(file.filename)
             file_extension = filename.rsplit('.', 1)[1].lower()
@@ -113,74 +120,123 @@ class DocumentProcessor:
             # Create unique filename
             unique_filename = f"{user_id}_{uuid.uuid4().hex}_{filename}"
             
-            # Save to temporary file for text extraction
-            temp_file_path = os.path.join(self.upload_folder, f"temp_{unique_filename}")
-            file.save(temp_file_path)
+            sha256 = hashlib.sha256()
+            data = None
+            temp_file_path = None
+            
+            if file_size <= self.memory_threshold:
+                # Small upload: keep the bytes in memory for hashing, extraction and storage
+                data = file.stream.read()
+                sha256.update(data)
+            else:
+                # Save to temporary file for text extraction, fingerprinting the content on the way
+                temp_file_path = os.path.join(self.upload_folder, f"temp_{unique_filename}")
+                with open(temp_file_path, 'wb') as temp_file:
+                    for chunk in iter(lambda: file.stream.read(self.READ_CHUNK_SIZE), b''):
+                        sha256.update(chunk)
+                        temp_file.write(chunk)
+            
+            return {
+                'success': True,
+                'user_id': user_id,
+                'filename': unique_filename,
+                'original_filename': file.filename,
+                'file_type': file_extension,
+                'file_size': file_size,
+                'sha256': sha256.hexdigest(),
+                'temp_path': temp_file_path,
+                'data': data
+            }
+            
+        except Exception as e:
+            print(f"Error saving uploaded file: {str(e)}")
+            return {'error': 'Error processing file. Please try again.'}
+    
+    def discard_upload(self, upload: dict):
+        """Delete the temporary file of an upload that does not need processing"""
+        temp_file_path = upload.get('temp_path')
+        if temp_file_path and os.path.exists(temp_file_path):
+            try:
+                os.remove(temp_file_path)
+            except Exception as e:
+                print(f"Warning: Could not delete temp file {temp_file_path}: {str(e)}")
+    
+    def process_saved_file(self, upload: dict) -> dict:
+        """
+        Extract text from a saved upload and move the file to permanent storage
+        
+        The temporary file, if any, is always consumed: it is either moved to
+        local storage or deleted once uploaded to Cloudinary. In-memory uploads
+        are only written to disk when they end up in local storage.
+        
+        Args:
+            upload: Dictionary returned by save_upload
+            
+        Returns:
+            Dictionary with file info, extracted text, and Cloudinary URLs
+        """
+        temp_file_path = upload.get('temp_path')
+        source = temp_file_path or upload['data']
+        unique_filename = upload['filename']
+        file_extension = upload['file_type']
+        
+        try:
+            # Configure Cloudinary
+            cloudinary_configured = self._configure_cloudinary()
             
             # Extract text based on file type
             if file_extension == 'pdf':
-                extracted_text = self.extract_text_from_pdf(temp_file_path)
+                extracted_text = self.extract_text_from_pdf(source)
             elif file_extension == 'docx':
-                extracted_text = self.extract_text_from_docx(temp_file_path)
+                extracted_text = self.extract_text_from_docx(source)
             else:
                 return {'error': 'Unsupported file type'}
             
             if not extracted_text:
                 return {'error': 'Could not extract text from file'}
             
+            # Precompute the AI context digest once, at upload time
+            context_digest = self.build_context_digest(extracted_text)
+            
+            result = {
+                'success': True,
+                'filename': unique_filename,
+                'original_filename': upload['original_filename'],
+                'file_type': file_extension,
+                'file_size': upload['file_size'],
+                'file_path': None,  # No local path when stored in Cloudinary
+                'extracted_text': extracted_text,
+                'context_digest': context_digest
+            }
             
             # Upload to Cloudinary only if configured
             if cloudinary_configured:
                 cloudinary_result = self._upload_to_cloudinary(
-                    temp_file_path, 
-                    user_id, 
+                    source, 
+                    upload['user_id'], 
                     unique_filename, 
                     file_extension
                 )
                 
-                if 'error' in cloudinary_result:
-                    # Fallback to local storage
-                    local_file_path = os.path.join(self.upload_folder, unique_filename)
-                    os.rename(temp_file_path, local_file_path)
-                    temp_file_path = None  # Don't delete in finally block
-                    
-                    return {
-                        'success': True,
-                        'filename': unique_filename,
-                        'original_filename': file.filename,
-                        'file_type': file_extension,
-                        'file_size': file_size,
-                        'file_path': local_file_path,
-                        'extracted_text': extracted_text
-                    }
-            else:
-                # Use local storage
-                local_file_path = os.path.join(self.upload_folder, unique_filename)
+                if 'error' not in cloudinary_result:
+                    result.update({
+                        'cloudinary_public_id': cloudinary_result['public_id'],
+                        'cloudinary_url': cloudinary_result['url'],
+                        'cloudinary_secure_url': cloudinary_result['secure_url']
+                    })
+                    return result
+            
+            # Use local storage (also the fallback when the Cloudinary upload failed)
+            local_file_path = os.path.join(self.upload_folder, unique_filename)
+            if temp_file_path:
                 os.rename(temp_file_path, local_file_path)
                 temp_file_path = None  # Don't delete in finally block
-                
-                return {
-                    'success': True,
-                    'filename': unique_filename,
-                    'original_filename': file.filename,
-                    'file_type': file_extension,
-                    'file_size': file_size,
-                    'file_path': local_file_path,
-                    'extracted_text': extracted_text
-                }
+            else:
+                with open(local_file_path, 'wb') as local_file:
+                    local_file.write(upload['data'])
             
-            return {
-                'success': True,
-                'filename': unique_filename,
-                'original_filename': file.filename,
-                'file_type': file_extension,
-                'file_size': file_size,
-                'file_path': None,  # No local path anymore
-                'extracted_text': extracted_text,
-                'cloudinary_public_id': cloudinary_result['public_id'],
-                'cloudinary_url': cloudinary_result['url'],
-                'cloudinary_secure_url': cloudinary_result['secure_url']
-            }
+            result['file_path'] = local_file_path
+            return result
             
         except Exception as e:
             print(f"Error processing file: {str(e)}")
@@ -194,6 +250,26 @@ class DocumentProcessor:
                 except Exception as e:
                     print(f"Warning: Could not delete temp file {temp_file_path}: {str(e)}")
     
+    def build_context_digest(self, text: str) -> dict:
+        """
+        Build the compact context digest stored alongside a document
+        
+        Holds just enough of the beginning and end of the text for
+        get_document_context, so AI requests never need the full text.
+        
+        Args:
+            text: Extracted document text
+            
+        Returns:
+            Dictionary with context_head, context_tail and content_length
+        """
+        doc_text = (text or "").strip()
+        return {
+            'context_head': doc_text[:self.DIGEST_HEAD_CHARS],
+            'context_tail': doc_text[-self.DIGEST_TAIL_CHARS:] if doc_text else "",
+            'content_length': len(doc_text)
+        }
+    
     def get_document_context(self, documents, max_length: int = 5000) -> str:
         """
         Get combined context from multiple documents, with intelligent extraction
@@ -213,26 +289,35 @@ class DocumentProcessor:
         # Intelligent distribution based on number of documents
         num_docs = len(documents)
         if num_docs == 1:
-            chars_per_doc = min(4500, max_length - 500)  # Reserve space for headers
+            chars_per_doc = min(self.DIGEST_HEAD_CHARS, max_length - 500)  # Reserve space for headers
         elif num_docs == 2:
             chars_per_doc = min(2200, (max_length - 200) // 2)  # Split between 2 docs
         else:
             chars_per_doc = min(1500, (max_length - 300) // num_docs)  # Distribute among all
         
         for doc in documents:
-            if doc.content_text:
+            # Prefer the precomputed digest; older documents fall back to the full text
+            if doc.has_context_digest:
+                digest = {
+                    'context_head': doc.context_head or "",
+                    'context_tail': doc.context_tail or "",
+                    'content_length': doc.content_length
+                }
+            else:
+                digest = self.build_context_digest(content_store.load(doc.id))
+            
+            if digest['content_length']:
                 combined_text += f"\n--- From {doc.original_filename} ---\n"
                 
                 # Extract intelligently: beginning + end for better context
-                doc_text = doc.content_text.strip()
-                if len(doc_text) <= chars_per_doc:
-                    # Document is small enough, use all of it
-                    combined_text += doc_text + "\n"
+                if digest['content_length'] <= chars_per_doc:
+                    # Document is small enough, use all of it (the head holds the whole text)
+                    combined_text += digest['context_head'] + "\n"
                 else:
                     # Document is large, extract beginning and end
                     half_chars = chars_per_doc // 2
-                    beginning = self._extract_complete_sentences(doc_text[:half_chars])
-                    ending = self._extract_complete_sentences(doc_text[-half_chars:], from_end=True)
+                    beginning = self._extract_complete_sentences(digest['context_head'][:half_chars])
+                    ending = self._extract_complete_sentences(digest['context_tail'][-half_chars:], from_end=True)
                     
                     combined_text += beginning
                     if beginning and ending:
@@ -281,12 +366,12 @@ class DocumentProcessor:
                     return text[:pos].strip()
             return text  # Fallback
     
-    def _upload_to_cloudinary(self, file_path: str, user_id: int, filename: str, file_extension: str) -> dict:
+    def _upload_to_cloudinary(self, source, user_id: int, filename: str, file_extension: str) -> dict:
         """
         Upload file to Cloudinary
         
         Args:
-            file_path: Local file path
+            source: Local file path or the file's bytes
             user_id: User ID for folder organization
             filename: Unique filename
             file_extension: File extension
@@ -299,7 +384,7 @@ class DocumentProcessor:
             public_id = f"documents/{user_id}/{filename.rsplit('.', 1)[0]}"
             
             upload_result = cloudinary.uploader.upload(
-                file_path,
+                source if isinstance(source, str) else (filename, source),
                 resource_type="raw",  # For non-image files
                 public_id=public_id,
                 tags=[f"user:{user_id}", f"type:{file_extension}"],
@@ -324,22 +409,36 @@ class DocumentProcessor:
         Args:
             document_model: Document model instance with file info
             
+        Returns:
+            True if deletion successful, False otherwise
+        """
+        cloudinary_public_id = document_model.cloudinary_public_id if document_model.is_cloudinary_stored else None
+        return self.delete_stored_file(cloudinary_public_id, document_model.upload_path)
+    
+    def delete_stored_file(self, cloudinary_public_id: Optional[str] = None, file_path: Optional[str] = None) -> bool:
+        """
+        Delete a stored file by its Cloudinary public id or local path
+        
+        Args:
+            cloudinary_public_id: Public id of the Cloudinary asset, if stored there
+            file_path: Local path of the file, if stored on disk
+            
         Returns:
             True if deletion successful, False otherwise
         """
         try:
             # If stored in Cloudinary, delete from there
-            if hasattr(document_model, 'is_cloudinary_stored') and document_model.is_cloudinary_stored:
+            if cloudinary_public_id:
                 self._configure_cloudinary()
                 result = cloudinary.uploader.destroy(
-                    document_model.cloudinary_public_id,
+                    cloudinary_public_id,
                     resource_type="raw"
                 )
                 return result.get('result') == 'ok'
             
             # Fallback: delete local file
-            elif document_model.upload_path and os.path.exists(document_model.upload_path):
-                os.remove(document_model.upload_path)
+            elif file_path and os.path.exists(file_path):
+                os.remove(file_path)
                 return True
                 
             return False
@@ -349,4 +448,6 @@ class DocumentProcessor:
             return False
 
 # Global instance
-document_processor = DocumentProcessor()
\ No newline at end of file
+document_processor = DocumentProcessor(
+    memory_threshold=int(os.getenv('UPLOAD_MEMORY_THRESHOLD', str(2 * 1024 * 1024)))
+)
\ No newline at end of file
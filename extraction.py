@@ -0,0 +1,352 @@
+import io
+import os
+import re
+import time
+import signal
+import threading
+import multiprocessing
+import zipfile
+import xml.etree.ElementTree as ET
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import PyPDF2
+from dotenv import load_dotenv
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+load_dotenv()
+
+class ExtractionTimeoutError(Exception):
+    """Raised when a file took longer than the pool's timeout to extract, or could not get a worker in time"""
+    pass
+
+class ExtractionFailedError(Exception):
+    """Raised when an extraction worker died, e.g. by running out of memory"""
+    pass
+
+def open_source(source):
+    """Open a file path, or wrap in-memory file bytes, as a binary file object"""
+    if isinstance(source, str):
+        return open(source, 'rb')
+    return io.BytesIO(source)
+
+def extract_pdf_text(source) -> str:
+    """Extract text content from a PDF file path or bytes"""
+    return "\n".join(extract_pdf_pages(source)).strip()
+
+def extract_pdf_pages(source, start: int = 0, stop: int = None) -> list:
+    """Extract the text of pages [start, stop) of a PDF file path or bytes, one string per page"""
+    with open_source(source) as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        pages = pdf_reader.pages[start:stop]
+        return [page.extract_text() for page in pages]
+
+def count_pdf_pages(source) -> int:
+    """Count the pages of a PDF file path or bytes"""
+    with open_source(source) as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+def _count_pdf_pages_timed(source) -> tuple:
+    """Count the pages of a PDF, also returning the seconds it took"""
+    started = time.monotonic()
+    return count_pdf_pages(source), time.monotonic() - started
+
+# WordprocessingML tags used by the streaming DOCX extractor
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+DOCX_BREAKS = {W_NS + 'tab': '\t', W_NS + 'ptab': '\t', W_NS + 'br': '\n', W_NS + 'cr': '\n', W_NS + 'noBreakHyphen': '-'}
+DOCX_NOTE_PARTS = ('word/footnotes.xml', 'word/endnotes.xml')
+
+def extract_docx_text(source) -> str:
+    """
+    Extract text content from a DOCX file path or bytes
+
+    Streams word/document.xml (then headers/footers and foot/endnotes) out
+    of the zip with iterparse, dropping each element once it has been
+    read, so memory stays bounded by the text rather than the document.
+    Table rows become one line each with cells separated by " | ".
+    """
+    with open_source(source) as file, zipfile.ZipFile(file) as archive:
+        names = archive.namelist()
+        lines = _docx_part_lines(archive, 'word/document.xml', keep_empty=True)
+
+        # Headers and footers usually repeat across sections; keep each line once
+        seen = set()
+        page_lines = []
+        for name in sorted(n for n in names if re.match(r'word/(header|footer)\d*\.xml$', n)):
+            for line in _docx_part_lines(archive, name):
+                if line not in seen:
+                    seen.add(line)
+                    page_lines.append(line)
+
+        note_lines = []
+        for name in DOCX_NOTE_PARTS:
+            if name in names:
+                note_lines += _docx_part_lines(archive, name)
+
+    text = "\n".join(lines).strip()
+    for extra in (page_lines, note_lines):
+        if extra:
+            text += "\n\n" + "\n".join(extra)
+    return text.strip()
+
+def _docx_part_lines(archive, name: str, keep_empty: bool = False) -> list:
+    """Stream one WordprocessingML part and return its paragraphs and table rows as lines"""
+    lines = []
+    paragraphs = []  # Stack of run-text buffers (text boxes nest paragraphs)
+    cells = []       # Stack of paragraph lists for open table cells
+    rows = []        # Stack of cell-text lists for open table rows
+    elements = []    # Open elements, so finished ones can be detached from their parent
+    fallback_depth = 0
+
+    def emit(line: str):
+        if cells:
+            cells[-1].append(line)
+        elif keep_empty or line.strip():
+            lines.append(line)
+
+    with archive.open(name) as part:
+        for event, elem in ET.iterparse(part, events=('start', 'end')):
+            tag = elem.tag
+
+            if event == 'start':
+                elements.append(elem)
+                if tag == MC_FALLBACK:
+                    fallback_depth += 1  # Duplicate of the mc:Choice content
+                elif fallback_depth:
+                    pass
+                elif tag == W_NS + 'p':
+                    paragraphs.append([])
+                elif tag == W_NS + 'tc':
+                    cells.append([])
+                elif tag == W_NS + 'tr':
+                    rows.append([])
+                continue
+
+            elements.pop()
+            if tag == MC_FALLBACK:
+                fallback_depth -= 1
+            elif fallback_depth:
+                pass
+            elif tag == W_NS + 't' and paragraphs:
+                paragraphs[-1].append(elem.text or '')
+            elif tag in DOCX_BREAKS and paragraphs:
+                paragraphs[-1].append(DOCX_BREAKS[tag])
+            elif tag == W_NS + 'p' and paragraphs:
+                emit(''.join(paragraphs.pop()))
+            elif tag == W_NS + 'tc' and cells:
+                cell_text = ' '.join(p for p in cells.pop() if p.strip())
+                if rows:
+                    rows[-1].append(cell_text)
+            elif tag == W_NS + 'tr' and rows:
+                emit(' | '.join(rows.pop()))
+
+            # Done with this element: drop it so the parsed tree never grows
+            if elements:
+                elements[-1].remove(elem)
+            else:
+                elem.clear()
+
+    return lines
+
+EXTRACTORS = {
+    'pdf': extract_pdf_text,
+    'docx': extract_docx_text
+}
+
+def _run_extraction(file_type: str, source) -> str:
+    """Entry point executed inside a pool worker"""
+    return EXTRACTORS[file_type](source)
+
+def _timed_call(timeout: float, fn, *args):
+    """
+    Pool entry point: run fn(*args), raising ExtractionTimeoutError once it has run for timeout seconds
+
+    The clock starts when the job starts running, not while it is queued,
+    and only this job fails; the worker process lives on for the next one.
+    """
+    if not timeout or not hasattr(signal, 'setitimer') or threading.current_thread() is not threading.main_thread():
+        return fn(*args)  # No interval timers here (Windows, or running inline in a request thread)
+
+    def expire(signum, frame):
+        raise ExtractionTimeoutError(f"Extraction took longer than {timeout:g} seconds")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def _limit_worker_memory(memory_limit: int):
+    """Pool worker initializer: cap the worker's address space so a hostile file cannot exhaust the host"""
+    if resource is not None and memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+class ExtractionPool:
+    """
+    Runs CPU-heavy text extraction in a bounded pool of worker processes
+
+    Request threads only wait on a future, so a large PDF no longer holds
+    the worker's GIL and other requests on the same worker keep being
+    served. Each worker process runs with an address-space limit. A job
+    gets timeout seconds of running time, measured inside the worker from
+    when it starts, so time spent queued behind other uploads does not
+    count and a job that overruns fails alone without touching the other
+    jobs in the pool. A job that cannot even get a worker within
+    queue_timeout is given up on. With min_shard_pages set, large PDFs are
+    split into page ranges so one upload can use every worker; it is off
+    by default because on typical hosts the extra parsing of each shard
+    outweighed the parallelism (see benchmark_pdf_extraction.py). With
+    max_workers=0 extraction runs inline.
+    """
+
+    def __init__(self, max_workers: int = 2, timeout: float = 60, memory_limit_mb: int = 512,
+                 min_shard_pages: int = 0, queue_timeout: float = 300):
+        self.max_workers = max_workers
+        self.min_shard_pages = min_shard_pages
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.memory_limit = memory_limit_mb * 1024 * 1024
+        self._executor = None
+        self._owner_pid = None
+        self._lock = threading.Lock()
+
+    def extract(self, file_type: str, source) -> str:
+        """
+        Extract text from a file in a worker process
+
+        Large PDFs are split into page ranges extracted in parallel if sharding is enabled.
+
+        Args:
+            file_type: 'pdf' or 'docx'
+            source: Path of the file to extract, or its bytes
+
+        Returns:
+            Extracted text
+
+        Raises:
+            ExtractionTimeoutError: The job did not finish within the timeout
+            ExtractionFailedError: The worker process died during the job
+        """
+        if file_type == 'pdf' and self.max_workers > 1 and self.min_shard_pages > 0:
+            return self.extract_pdf_sharded(source)
+        return self.run(_run_extraction, file_type, source)
+
+    def extract_pdf_sharded(self, source) -> str:
+        """
+        Extract a PDF by handing page ranges to the pool and joining the pages once
+
+        PDFs shorter than two shards are extracted by a single worker. Counting
+        the pages and extracting them share one timeout: the extraction step
+        only gets what the count left of it.
+        """
+        page_count, counting_time = self.run(_count_pdf_pages_timed, source)
+        remaining = self.timeout - counting_time
+
+        shard_count = min(self.max_workers, page_count // self.min_shard_pages)
+        if shard_count < 2:
+            return self.run(_run_extraction, 'pdf', source, timeout=remaining)
+
+        shard_size = -(-page_count // shard_count)  # Ceiling division
+        shards = self.run_many(
+            [(extract_pdf_pages, source, start, start + shard_size) for start in range(0, page_count, shard_size)],
+            timeout=remaining
+        )
+        return "\n".join(page for shard in shards for page in shard).strip()
+
+    def run(self, fn, *args, timeout: float = None):
+        """Run a picklable, module-level function in the pool and wait for its result"""
+        return self.run_many([(fn,) + args], timeout=timeout)[0]
+
+    def run_many(self, calls: list, timeout: float = None) -> list:
+        """
+        Run several (fn, *args) calls in the pool and wait for all of their results
+
+        Args:
+            calls: List of tuples of a picklable, module-level function and its arguments
+            timeout: Seconds each call may run once it starts (default: the pool's timeout)
+
+        Returns:
+            Results in the order of calls
+        """
+        if self.max_workers <= 0:
+            return [fn(*args) for fn, *args in calls]
+
+        run_timeout = self.timeout if timeout is None else timeout
+        if run_timeout <= 0:
+            raise ExtractionTimeoutError(f"Extraction took longer than {self.timeout:g} seconds")
+
+        executor = self._get_executor()
+        try:
+            futures = [executor.submit(_timed_call, run_timeout, fn, *args) for fn, *args in calls]
+        except BrokenProcessPool:
+            # A worker died in an earlier job; start a fresh pool and retry once
+            self._discard(executor)
+            executor = self._get_executor()
+            futures = [executor.submit(_timed_call, run_timeout, fn, *args) for fn, *args in calls]
+
+        # Backstop for a job stuck in the queue (or in C code the timer cannot interrupt)
+        give_up_at = time.monotonic() + self.queue_timeout + run_timeout
+        try:
+            return [future.result(timeout=max(0, give_up_at - time.monotonic())) for future in futures]
+        except concurrent.futures.TimeoutError:
+            for future in futures:
+                future.cancel()  # Queued calls never start; running ones stop at their own timer
+            raise ExtractionTimeoutError("Extraction did not get a free worker in time")
+        except ExtractionTimeoutError:
+            for future in futures:
+                future.cancel()
+            raise
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise ExtractionFailedError("Extraction worker exited unexpectedly")
+        except MemoryError:
+            for future in futures:
+                future.cancel()
+            raise ExtractionFailedError("Extraction exceeded the worker memory limit")
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            # Each gunicorn worker process owns its own pool
+            if self._executor is None or self._owner_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=self._mp_context(),
+                    initializer=_limit_worker_memory,
+                    initargs=(self.memory_limit,)
+                )
+                self._owner_pid = os.getpid()
+            return self._executor
+
+    def _mp_context(self):
+        # Never fork the multithreaded web worker directly; forkserver/spawn children start clean
+        methods = multiprocessing.get_all_start_methods()
+        return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+    def _discard(self, executor: ProcessPoolExecutor):
+        """Drop a broken pool; the next job starts a new one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+# Global instance
+extraction_pool = ExtractionPool(
+    max_workers=int(os.getenv('EXTRACTION_WORKERS', '2')),
+    timeout=float(os.getenv('EXTRACTION_TIMEOUT', '60')),
+    memory_limit_mb=int(os.getenv('EXTRACTION_MEMORY_MB', '512')),
+    min_shard_pages=int(os.getenv('EXTRACTION_MIN_SHARD_PAGES', '0')),
+    queue_timeout=float(os.getenv('EXTRACTION_QUEUE_TIMEOUT', '300'))
+)
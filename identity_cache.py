@@ -0,0 +1,278 @@
+import os
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+from collections import OrderedDict
+from typing import Iterable, Optional
+from sqlalchemy import select, and_, event
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.orm.attributes import set_committed_value
+from dotenv import load_dotenv
+from models import db, User, Subscription
+from rate_limiter import RespClient
+
+load_dotenv()
+
+class SQLiteGenerationStore:
+    """
+    Per-user generation stamps in a local SQLite file, shared by every worker process on the host
+
+    A stamp is an opaque token that changes whenever the user's identity
+    data is written; a snapshot taken under another stamp is stale.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS identity_generations "
+                "(user_id INTEGER PRIMARY KEY, generation TEXT NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, reopened after a fork (closing the last one checkpoints the WAL)"""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, user_id: int) -> str:
+        row = self._connection().execute(
+            "SELECT generation FROM identity_generations WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else ''
+
+    def bump(self, user_ids: Iterable[int]):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO identity_generations (user_id, generation) VALUES (?, ?)",
+                [(user_id, uuid.uuid4().hex) for user_id in user_ids]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+class RedisGenerationStore:
+    """
+    Per-user generation stamps in a Redis-protocol server, shared by every worker and instance
+
+    Stamps expire once no snapshot can still hold them; a missing stamp
+    reads as empty, and a new stamp is always a fresh random token, so an
+    expired stamp can never come back and match an old snapshot.
+    """
+
+    def __init__(self, url: str, expire_seconds: int, timeout: float = 1.0, prefix: str = 'writify:identity:'):
+        self.client = RespClient(url, timeout=timeout)
+        self.expire_seconds = expire_seconds
+        self.prefix = prefix
+
+    def get(self, user_id: int) -> str:
+        return self.client.execute(('GET', f"{self.prefix}{user_id}"))[0] or ''
+
+    def bump(self, user_ids: Iterable[int]):
+        commands = [('SET', f"{self.prefix}{user_id}", uuid.uuid4().hex, 'EX', self.expire_seconds)
+                    for user_id in user_ids]
+        if commands:
+            self.client.execute(*commands)
+
+class IdentityCache:
+    """
+    Short-lived snapshots of users and their active subscription for Flask-Login
+
+    Each request used to query the user in load_user and then the active
+    subscription (context processor, billing pages). Both now come from a
+    single query, and the resulting snapshot is kept in-process for ttl
+    seconds. A request served from a snapshot attaches the user to the
+    session without any query; the subscription is memoized on the user
+    for the rest of the request. Committed ORM writes to a User or
+    Subscription (webhooks, checkout, email verification, profile and
+    password changes) drop that user's snapshot in this process and bump
+    the user's generation stamp in the shared generations store; every
+    process checks the stamp before serving a snapshot, so the change is
+    seen everywhere on the next request. Without a shared store other
+    processes only pick it up when their snapshot expires. Bulk UPDATEs
+    that bypass the ORM must call invalidate() or invalidate_many().
+    """
+
+    def __init__(self, ttl: float = 30, max_entries: int = 10000, generations=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generations = generations
+        self._entries = OrderedDict()  # user_id -> (expires_at, generation, user_values, subscription_values)
+        self._lock = threading.Lock()
+
+    def load_user(self, user_id: int) -> Optional[User]:
+        """
+        Get a user attached to the current session, with its active subscription memoized
+
+        Args:
+            user_id: ID from the Flask-Login session
+
+        Returns:
+            User model instance, or None if the user does not exist
+        """
+        existing = db.session.identity_map.get(identity_key(User, user_id))
+        if existing is not None:
+            return existing  # Already loaded in this session; never overwrite its state
+
+        # Read the stamp before the row, so a write committed in between is caught next time
+        generation = self._generation(user_id)
+        snapshot = self._get(user_id, generation)
+        if snapshot is None:
+            snapshot = self._load_snapshot(user_id)
+            if snapshot is None:
+                return None
+            if self.ttl > 0 and generation is not None:
+                self._set(user_id, generation, snapshot)
+
+        user_values, subscription_values = snapshot
+        user = db.session.merge(self._detached(User, user_values), load=False)
+        subscription = None
+        if subscription_values is not None:
+            subscription = db.session.merge(self._detached(Subscription, subscription_values), load=False)
+        user._current_subscription = subscription
+        return user
+
+    def invalidate(self, user_id: int):
+        """Forget a user's snapshot in every process"""
+        self.invalidate_many([user_id])
+
+    def invalidate_many(self, user_ids: Iterable[int]):
+        """Forget the snapshots of several users in every process"""
+        user_ids = list(user_ids)
+        self._forget(user_ids)
+        if self.generations is None or not user_ids:
+            return
+
+        try:
+            self.generations.bump(user_ids)
+        except Exception as e:
+            print(f"Error publishing identity cache invalidation: {str(e)}")
+
+    def clear(self):
+        """Forget every snapshot in this process"""
+        with self._lock:
+            self._entries.clear()
+
+    def _forget(self, user_ids: Iterable[int]):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def _generation(self, user_id: int) -> Optional[str]:
+        """Current generation stamp of a user, or None if it cannot be read (then nothing is cached)"""
+        if self.generations is None:
+            return ''
+        try:
+            return self.generations.get(user_id)
+        except Exception as e:
+            print(f"Error reading identity cache generation: {str(e)}")
+            return None
+
+    def _get(self, user_id: int, generation: Optional[str]):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic() or entry[1] != generation:
+                del self._entries[user_id]
+                return None
+            return entry[2], entry[3]
+
+    def _set(self, user_id: int, generation: str, snapshot: tuple):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._entries[user_id] = (time.monotonic() + self.ttl, generation) + snapshot
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _load_snapshot(self, user_id: int) -> Optional[tuple]:
+        """Read the user and its active subscription in one round trip"""
+        row = db.session.execute(
+            select(User, Subscription)
+            .outerjoin(Subscription, and_(Subscription.user_id == User.id, Subscription.status == 'active'))
+            .where(User.id == user_id)
+            .limit(1)
+        ).first()
+        if row is None:
+            return None
+
+        return (
+            self._column_values(row.User),
+            self._column_values(row.Subscription) if row.Subscription is not None else None
+        )
+
+    def _column_values(self, instance) -> dict:
+        return {column.key: getattr(instance, column.key) for column in instance.__mapper__.column_attrs}
+
+    def _detached(self, model, values: dict):
+        """Build a clean, detached instance from column values, as if it had been loaded"""
+        instance = model.__mapper__.class_manager.new_instance()
+        for key, value in values.items():
+            set_committed_value(instance, key, value)
+        make_transient_to_detached(instance)
+        return instance
+
+    def _collect_changes(self, session, flush_context):
+        """after_flush: remember which users had their row or subscriptions written"""
+        changed = session.info.setdefault('identity_cache_changed', set())
+        for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(instance, User):
+                changed.add(instance.id)
+            elif isinstance(instance, Subscription):
+                changed.add(instance.user_id)
+
+        # Drop them right away too, so this process does not serve them mid-transaction
+        self._forget(changed)
+
+    def _publish_changes(self, session):
+        """after_commit: drop the changed users' snapshots in every process"""
+        changed = session.info.pop('identity_cache_changed', ())
+        if changed:
+            self.invalidate_many(changed)
+
+    def _discard_changes(self, session):
+        """after_rollback: drop snapshots that may have been cached during the transaction"""
+        self._forget(session.info.pop('identity_cache_changed', ()))
+
+def create_generation_store(ttl: float):
+    """Create the shared generation store configured by the IDENTITY_CACHE_* environment variables"""
+    backend_name = os.getenv('IDENTITY_CACHE_BACKEND', 'sqlite').lower()
+
+    if backend_name == 'redis':
+        url = os.getenv('IDENTITY_CACHE_REDIS_URL') or os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+        return RedisGenerationStore(url, expire_seconds=max(60, int(ttl) * 2))
+    if backend_name == 'sqlite':
+        path = os.getenv('IDENTITY_CACHE_PATH') or os.path.join(tempfile.gettempdir(), 'writify_identity_generations.sqlite3')
+        try:
+            return SQLiteGenerationStore(path)
+        except Exception as e:
+            print(f"⚠️ Could not open shared identity cache store at {path}: {str(e)}")
+            print("⚠️ Other workers will see identity changes only when their snapshots expire")
+    return None  # Invalidation stays within the writing process
+
+# Global instance
+identity_cache = IdentityCache(
+    ttl=float(os.getenv('IDENTITY_CACHE_TTL', '30')),
+    max_entries=int(os.getenv('IDENTITY_CACHE_MAX_ENTRIES', '10000')),
+    generations=create_generation_store(float(os.getenv('IDENTITY_CACHE_TTL', '30')))
+)
+
+event.listen(Session, 'after_flush', identity_cache._collect_changes)
+event.listen(Session, 'after_commit', identity_cache._publish_changes)
+event.listen(Session, 'after_rollback', identity_cache._discard_changes)
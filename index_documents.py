@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Build the retrieval index for documents uploaded before chunking existed
+Run this once after migration 006; it is safe to run again
+"""
+
+from app import create_app
+from models import db, Document
+from retrieval import document_retriever
+from content_store import content_store
+
+def index_documents(batch_size=50):
+    """Chunk and index every document that has no retrieval index yet"""
+    app = create_app()
+
+    with app.app_context():
+        indexed = 0
+        while True:
+            documents = Document.query.filter(
+                Document.chunk_count.is_(None),
+                Document.content.has()
+            ).limit(batch_size).all()
+
+            if not documents:
+                break
+
+            texts = content_store.load_many([document.id for document in documents])
+            for document in documents:
+                document_retriever.index_document(document, texts.get(document.id, ''))
+            db.session.commit()
+
+            indexed += len(documents)
+            print(f"📚 Indexed {indexed} documents...")
+
+        print(f"✅ Retrieval index up to date ({indexed} documents indexed)")
+
+if __name__ == '__main__':
+    index_documents()
@@ -1,9 +1,21 @@
-from flask import Blueprint, render_template, request, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, Response, stream_with_context, current_app
 from flask_login import login_required, current_user
-from models import db, Document, Text
-from ai_service import ai_assistant
+from sqlalchemy import select, func, tuple_, exists, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import load_only, undefer
+from models import db, Document, DocumentChunk, StagedUpload, Text, text_documents
+from ai_engine import suggestion_engine, RequestCancelledError
+from ai_service import CONTEXT_MAX_CHARS
 from document_processor import document_processor
-from subscription_middleware import subscription_required, api_subscription_required
+from retrieval import document_retriever
+from upload_pipeline import upload_pipeline
+from blob_store import blob_store
+from subscription_middleware import subscription_required, api_subscription_required, UsageLimits
+from security import rate_limit
+from datetime import datetime
+import base64
+import html
+import json
 import os
 
 main_bp = Blueprint('main', __name__)
@@ -18,14 +30,24 @@ def index():
 @login_required
 @subscription_required
 def dashboard():
-    # Get user's documents and texts
-    user_documents = Document.query.filter_by(user_id=current_user.id).all()
-    user_texts = Text.query.filter_by(user_id=current_user.id).order_by(Text.updated_at.desc()).all()
-    return render_template('dashboard.html', user=current_user, documents=user_documents, texts=user_texts)
+    # Get user's documents and the first page of texts (metadata only, no content)
+    user_documents = Document.query.filter_by(user_id=current_user.id).options(
+        load_only(
+            Document.id,
+            Document.original_filename,
+            Document.file_type,
+            Document.file_size,
+            Document.status
+        )
+    ).all()
+    user_texts, next_cursor = _list_texts(limit=TEXT_PAGE_SIZE)
+    return render_template('dashboard.html', user=current_user, documents=user_documents, texts=user_texts,
+                           texts_next_cursor=next_cursor)
 
 @main_bp.route('/api/ai-assist', methods=['POST'])
 @login_required
 @api_subscription_required
+@rate_limit(max_requests=20, per_seconds=60)  # Per user; the daily quota is in UsageLimits
 def ai_assist():
     """Generate AI writing suggestions"""
     try:
@@ -33,6 +55,9 @@ def ai_assist():
         title = data.get('title', '').strip()
         text = data.get('text', '').strip()
         current_text_id = data.get('current_text_id', None)  # Optional: current active text ID
+        stream = bool(data.get('stream', False))  # Optional: stream suggestions as Server-Sent Events
+        client_id = data.get('client_id', None)  # Optional: id of the editor instance (one per tab)
+        request_id = data.get('request_id', None)  # Optional: client-side id used to match aborts
         
         if not title:
             return jsonify({'error': 'Title is required'}), 400
@@ -47,11 +72,48 @@ def ai_assist():
             ).first()
             
             if current_text:
-                associated_documents = current_text.documents.all()
-                document_context = document_processor.get_document_context(associated_documents)
+                # Only the small digest columns are needed, not the full extracted text
+                associated_documents = current_text.documents.options(
+                    load_only(
+                        Document.id,
+                        Document.original_filename,
+                        Document.context_head,
+                        Document.context_tail,
+                        Document.content_length,
+                        Document.chunk_count,
+                        Document.token_count
+                    )
+                ).all()
+                # Relevance-ranked chunks for what the user is writing about right now
+                document_context = document_retriever.get_relevant_context(
+                    associated_documents, title, text, max_length=CONTEXT_MAX_CHARS
+                )
+        
+        # A newer request on the same text from the same editor supersedes (and cancels) this one
+        request_key = _ai_request_key(current_text_id, client_id)
+        
+        # Count the request against today's quota before spending anything on it; the engine
+        # gives it back unless the answer came from an upstream call this request started
+        if not UsageLimits.reserve_ai_request(current_user):
+            db.session.rollback()
+            return jsonify({
+                'error': 'Daily AI request limit reached',
+                'limit': UsageLimits.get_ai_requests_limit(current_user)
+            }), 429
+        db.session.commit()
+        refund = _ai_request_refund(current_user._get_current_object())
+        
+        if stream:
+            return _stream_suggestions(title, text, document_context, request_key, request_id, refund)
         
         # Generate suggestions
-        suggestions = ai_assistant.get_suggestions(title, text, document_context)
+        try:
+            suggestions = suggestion_engine.get_suggestions(
+                title, text, document_context,
+                request_key=request_key, request_id=request_id, refund=refund
+            )
+        except RequestCancelledError:
+            return jsonify({'success': False, 'cancelled': True}), 409
         
         return jsonify({
             'success': True,
@@ -62,52 +124,170 @@ def ai_assist():
         print(f"Error in ai_assist: {str(e)}")
         return jsonify({'error': 'Failed to generate suggestions'}), 500
 
+def _ai_request_key(current_text_id, client_id=None):
+    """Identify the client channel an AI request belongs to: one editor instance on one text"""
+    if not isinstance(client_id, str) or len(client_id) > 64:
+        client_id = None
+    return (current_user.id, current_text_id, client_id)
+
+def _ai_request_refund(user):
+    """Callable that gives back the AI request reserved for user (cache hits, shared calls, cancellations)"""
+    def refund():
+        try:
+            UsageLimits.release_ai_request(user)
+            db.session.commit()
+        except Exception as e:
+            print(f"Error releasing AI request quota: {str(e)}")
+            db.session.rollback()
+    return refund
+
+def _stream_suggestions(title, text, document_context, request_key=None, request_id=None, refund=None):
+    """Send each suggestion to the client as an SSE event as soon as it is parsed"""
+    def generate():
+        try:
+            for suggestion in suggestion_engine.stream_suggestions(
+                title, text, document_context,
+                request_key=request_key, request_id=request_id, refund=refund
+            ):
+                yield f"event: suggestion\ndata: {json.dumps(suggestion)}\n\n"
+        except RequestCancelledError:
+            yield "event: cancelled\ndata: {}\n\n"
+            return
+        yield "event: done\ndata: {}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering so events are flushed immediately
+        }
+    )
+
+@main_bp.route('/api/ai-assist/abort', methods=['POST'])
+@login_required
+def abort_ai_assist():
+    """Cancel the in-flight AI request for a text"""
+    data = request.get_json(silent=True) or {}
+    current_text_id = data.get('current_text_id', None)
+    client_id = data.get('client_id', None)
+    request_id = data.get('request_id', None)
+    
+    cancelled = suggestion_engine.abort(_ai_request_key(current_text_id, client_id), request_id)
+    
+    return jsonify({
+        'success': True,
+        'cancelled': cancelled
+    })
+
 @main_bp.route('/api/upload', methods=['POST'])
 @login_required
 @api_subscription_required
+@rate_limit(max_requests=10, per_seconds=60)
 def upload_document():
-    """Handle document upload"""
+    """Accept a document upload; extraction and storage continue in the background"""
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
         
         file = request.files['file']
-        result = document_processor.process_uploaded_file(file, current_user.id)
+        upload = document_processor.save_upload(file, current_user.id)
         
-        if 'error' in result:
-            return jsonify(result), 400
+        if 'error' in upload:
+            return jsonify(upload), 400
         
-        # Save document info to database
+        # Counted in the same transaction as the document row
+        if not UsageLimits.reserve_document(current_user):
+            db.session.rollback()
+            document_processor.discard_upload(upload)
+            return jsonify({
+                'error': 'Document limit reached',
+                'limit': UsageLimits.get_document_limit(current_user)
+            }), 403
+        
+        # Save document info to database, to be completed by the upload pipeline
         document = Document(
             user_id=current_user.id,
-            filename=result['filename'],
-            original_filename=result['original_filename'],
-            file_type=result['file_type'],
-            file_size=result['file_size'],
-            content_text=result['extracted_text'],
-            upload_path=result.get('file_path'),  # May be None for Cloudinary uploads
-            cloudinary_public_id=result.get('cloudinary_public_id'),
-            cloudinary_url=result.get('cloudinary_url'),
-            cloudinary_secure_url=result.get('cloudinary_secure_url')
+            filename=upload['filename'],
+            original_filename=upload['original_filename'],
+            file_type=upload['file_type'],
+            file_size=upload['file_size'],
+            status='processing',
+            upload_sha256=upload['sha256'],
+            staged_path=upload['temp_path']
         )
         
         db.session.add(document)
+        if upload['data'] is not None:
+            db.session.flush()
+            db.session.add(StagedUpload(document_id=document.id, data=upload['data']))
         db.session.commit()
         
+        upload_pipeline.submit(current_app._get_current_object())
+        
         return jsonify({
             'success': True,
+            'job_id': document.id,
+            'status': document.status,
             'document': {
                 'id': document.id,
                 'filename': document.original_filename,
                 'file_type': document.file_type,
-                'file_size': document.file_size
+                'file_size': document.file_size,
+                'status': document.status
             }
-        })
+        }), 202
         
     except Exception as e:
         print(f"Error in upload_document: {str(e)}")
         return jsonify({'error': 'Failed to upload document'}), 500
 
+@main_bp.route('/api/documents/<int:document_id>/status', methods=['GET'])
+@login_required
+def get_document_status(document_id):
+    """Get the upload pipeline status of a document"""
+    try:
+        document = Document.query.options(
+            load_only(
+                Document.id,
+                Document.original_filename,
+                Document.file_type,
+                Document.file_size,
+                Document.status,
+                Document.error_message,
+                Document.claimed_at,
+                Document.attempts,
+                Document.staged_path
+            )
+        ).filter_by(
+            id=document_id,
+            user_id=current_user.id
+        ).first()
+        
+        if not document:
+            return jsonify({'error': 'Document not found'}), 404
+        
+        if upload_pipeline.check_stale(document):
+            db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'job_id': document.id,
+            'status': document.status,
+            'error': document.error_message,
+            'document': {
+                'id': document.id,
+                'filename': document.original_filename,
+                'file_type': document.file_type,
+                'file_size': document.file_size,
+                'status': document.status
+            }
+        })
+        
+    except Exception as e:
+        print(f"Error in get_document_status: {str(e)}")
+        return jsonify({'error': 'Failed to fetch document status'}), 500
+
 @main_bp.route('/api/documents/<int:document_id>', methods=['DELETE'])
 @login_required
 def delete_document(document_id):
@@ -121,11 +301,15 @@ def delete_document(document_id):
         if not document:
             return jsonify({'error': 'Document not found'}), 404
         
-        # Delete file from Cloudinary or disk
-        document_processor.delete_file(document)
+        # Delete a still staged upload, and the file from Cloudinary or disk unless other documents still share it
+        if document.staged_path:
+            document_processor.discard_upload({'temp_path': document.staged_path})
+        if blob_store.release(document):
+            document_processor.delete_file(document)
         
         # Delete from database
         db.session.delete(document)
+        UsageLimits.release_document(current_user)
         db.session.commit()
         
         return jsonify({'success': True})
@@ -135,32 +319,98 @@ def delete_document(document_id):
         return jsonify({'error': 'Failed to delete document'}), 500
 
 # Text CRUD Routes
+TEXT_PAGE_SIZE = 50
+MAX_TEXT_PAGE_SIZE = 100
+
 @main_bp.route('/api/texts', methods=['GET'])
 @login_required
 def get_texts():
-    """Get all texts for the current user"""
+    """
+    List the current user's texts, most recently updated first
+
+    Returns metadata and a short excerpt only; the editor gets the full
+    content from GET /api/texts/<id>. Pages are chained with the
+    next_cursor value of the previous response (?cursor=...&limit=...).
+    """
     try:
-        texts = Text.query.filter_by(user_id=current_user.id).order_by(Text.updated_at.desc()).all()
+        limit = _page_limit(TEXT_PAGE_SIZE, MAX_TEXT_PAGE_SIZE)
+        
+        cursor = request.args.get('cursor')
+        try:
+            after = _decode_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        texts, next_cursor = _list_texts(limit=limit, after=after)
         
         texts_data = []
         for text in texts:
             texts_data.append({
                 'id': text.id,
                 'title': text.title,
-                'content': text.content,
+                'excerpt': text.excerpt or '',
                 'created_at': text.created_at.isoformat(),
                 'updated_at': text.updated_at.isoformat()
             })
         
         return jsonify({
             'success': True,
-            'texts': texts_data
+            'texts': texts_data,
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
         print(f"Error in get_texts: {str(e)}")
         return jsonify({'error': 'Failed to fetch texts'}), 500
 
+def _list_texts(limit: int, after: tuple = None) -> tuple:
+    """
+    One page of the current user's texts without their content
+
+    Keyset pagination on (updated_at, id), which idx_texts_user_updated
+    serves directly, so deep pages cost the same as the first one.
+
+    Args:
+        limit: Page size
+        after: (updated_at, id) of the last text on the previous page
+
+    Returns:
+        Tuple of (texts, cursor for the next page or None)
+    """
+    query = select(Text).options(
+        load_only(Text.id, Text.title, Text.excerpt, Text.created_at, Text.updated_at)
+    ).where(
+        Text.user_id == current_user.id
+    ).order_by(Text.updated_at.desc(), Text.id.desc()).limit(limit + 1)
+    
+    if after is not None:
+        query = query.where(tuple_(Text.updated_at, Text.id) < tuple_(*after))
+    
+    texts = db.session.scalars(query).all()
+    if len(texts) <= limit:
+        return texts, None
+    
+    texts = texts[:limit]
+    return texts, _encode_cursor(texts[-1].updated_at, texts[-1].id)
+
+def _page_limit(default: int, maximum: int) -> int:
+    """Page size from the ?limit= query argument, clamped to [1, maximum]"""
+    try:
+        return min(max(int(request.args.get('limit', default)), 1), maximum)
+    except ValueError:
+        return default
+
+def _encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Opaque keyset pagination cursor for a (timestamp, id) position"""
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor: str) -> tuple:
+    """Parse a cursor from _encode_cursor; raises ValueError if it is malformed"""
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    updated_at, text_id = raw.split('|')
+    return datetime.fromisoformat(updated_at), int(text_id)
+
 @main_bp.route('/api/texts', methods=['POST'])
 @login_required
 @api_subscription_required
@@ -174,6 +424,14 @@ def create_text():
         if not title:
             return jsonify({'error': 'Title is required'}), 400
         
+        # Counted in the same transaction as the text row
+        if not UsageLimits.reserve_text(current_user):
+            db.session.rollback()
+            return jsonify({
+                'error': 'Text limit reached',
+                'limit': UsageLimits.get_text_limit(current_user)
+            }), 403
+        
         # Create new text
         text = Text(
             user_id=current_user.id,
@@ -189,7 +447,7 @@ def create_text():
             'text': {
                 'id': text.id,
                 'title': text.title,
-                'content': text.content,
+                'content': content,
                 'created_at': text.created_at.isoformat(),
                 'updated_at': text.updated_at.isoformat()
             }
@@ -207,7 +465,7 @@ def get_text(text_id):
         text = Text.query.filter_by(
             id=text_id,
             user_id=current_user.id
-        ).first()
+        ).options(undefer(Text.content)).first()
         
         if not text:
             return jsonify({'error': 'Text not found'}), 404
@@ -258,7 +516,7 @@ def update_text(text_id):
             'text': {
                 'id': text.id,
                 'title': text.title,
-                'content': text.content,
+                'content': content,
                 'created_at': text.created_at.isoformat(),
                 'updated_at': text.updated_at.isoformat()
             }
@@ -282,6 +540,7 @@ def delete_text(text_id):
             return jsonify({'error': 'Text not found'}), 404
         
         db.session.delete(text)
+        UsageLimits.release_text(current_user)
         db.session.commit()
         
         return jsonify({'success': True})
@@ -291,36 +550,53 @@ def delete_text(text_id):
         return jsonify({'error': 'Failed to delete text'}), 500
 
 # Text-Document Association Routes
+DOCUMENT_PAGE_SIZE = 50
+MAX_DOCUMENT_PAGE_SIZE = 100
+
+# Metadata shown in document lists; never the extracted text
+DOCUMENT_LIST_COLUMNS = (
+    Document.id,
+    Document.original_filename,
+    Document.file_type,
+    Document.file_size,
+    Document.created_at
+)
+
+def _owns(model, object_id: int) -> bool:
+    """Check that a Text or Document with this id belongs to the current user, without loading it"""
+    return db.session.scalar(
+        select(exists().where(model.id == object_id, model.user_id == current_user.id))
+    )
+
+def _document_list_item(row) -> dict:
+    return {
+        'id': row.id,
+        'filename': row.original_filename,
+        'file_type': row.file_type,
+        'file_size': row.file_size,
+        'created_at': row.created_at.isoformat()
+    }
+
 @main_bp.route('/api/texts/<int:text_id>/documents', methods=['GET'])
 @login_required
 def get_text_documents(text_id):
     """Get all documents associated with a specific text"""
     try:
         # Verify text belongs to current user
-        text = Text.query.filter_by(
-            id=text_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not text:
+        if not _owns(Text, text_id):
             return jsonify({'error': 'Text not found'}), 404
         
-        # Get associated documents
-        documents = text.documents.all()
-        
-        documents_data = []
-        for doc in documents:
-            documents_data.append({
-                'id': doc.id,
-                'filename': doc.original_filename,
-                'file_type': doc.file_type,
-                'file_size': doc.file_size,
-                'created_at': doc.created_at.isoformat()
-            })
+        # Get associated documents (metadata only)
+        rows = db.session.execute(
+            select(*DOCUMENT_LIST_COLUMNS)
+            .join(text_documents, text_documents.c.document_id == Document.id)
+            .where(text_documents.c.text_id == text_id)
+            .order_by(text_documents.c.created_at, Document.id)
+        ).all()
         
         return jsonify({
             'success': True,
-            'documents': documents_data
+            'documents': [_document_list_item(row) for row in rows]
         })
         
     except Exception as e:
@@ -332,30 +608,25 @@ def get_text_documents(text_id):
 def associate_document_to_text(text_id, document_id):
     """Associate a document with a text"""
     try:
-        # Verify text belongs to current user
-        text = Text.query.filter_by(
-            id=text_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not text:
+        # Verify text and document belong to current user
+        if not _owns(Text, text_id):
             return jsonify({'error': 'Text not found'}), 404
         
-        # Verify document belongs to current user
-        document = Document.query.filter_by(
-            id=document_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not document:
+        if not _owns(Document, document_id):
             return jsonify({'error': 'Document not found'}), 404
         
-        # Check if already associated
-        if document in text.documents:
+        # Associate document with text; the primary key rejects an existing association
+        associated = db.session.execute(
+            insert(text_documents)
+            .values(text_id=text_id, document_id=document_id)
+            .on_conflict_do_nothing()
+            .returning(text_documents.c.text_id)
+        ).scalar()
+        
+        if associated is None:
+            db.session.rollback()
             return jsonify({'error': 'Document already associated with this text'}), 400
         
-        # Associate document with text
-        text.documents.append(document)
         db.session.commit()
         
         return jsonify({
@@ -372,30 +643,24 @@ def associate_document_to_text(text_id, document_id):
 def disassociate_document_from_text(text_id, document_id):
     """Remove association between a document and a text"""
     try:
-        # Verify text belongs to current user
-        text = Text.query.filter_by(
-            id=text_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not text:
+        # Verify text and document belong to current user
+        if not _owns(Text, text_id):
             return jsonify({'error': 'Text not found'}), 404
         
-        # Verify document belongs to current user
-        document = Document.query.filter_by(
-            id=document_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not document:
+        if not _owns(Document, document_id):
             return jsonify({'error': 'Document not found'}), 404
         
-        # Check if document is associated
-        if document not in text.documents:
+        # Remove association, if there is one
+        removed = db.session.execute(
+            delete(text_documents)
+            .where(text_documents.c.text_id == text_id, text_documents.c.document_id == document_id)
+            .returning(text_documents.c.text_id)
+        ).scalar()
+        
+        if removed is None:
+            db.session.rollback()
             return jsonify({'error': 'Document not associated with this text'}), 400
         
-        # Remove association
-        text.documents.remove(document)
         db.session.commit()
         
         return jsonify({
@@ -410,41 +675,155 @@ def disassociate_document_from_text(text_id, document_id):
 @main_bp.route('/api/texts/<int:text_id>/available-documents', methods=['GET'])
 @login_required
 def get_available_documents_for_text(text_id):
-    """Get all user's documents that are not yet associated with the text"""
+    """
+    Get the user's documents that are not yet associated with the text
+
+    Newest first, paged like GET /api/texts (?cursor=...&limit=...).
+    """
     try:
         # Verify text belongs to current user
-        text = Text.query.filter_by(
-            id=text_id,
-            user_id=current_user.id
-        ).first()
-        
-        if not text:
+        if not _owns(Text, text_id):
             return jsonify({'error': 'Text not found'}), 404
         
-        # Get all user's documents
-        all_documents = Document.query.filter_by(user_id=current_user.id).all()
-        
-        # Get documents already associated with this text
-        associated_document_ids = [doc.id for doc in text.documents.all()]
+        limit = _page_limit(DOCUMENT_PAGE_SIZE, MAX_DOCUMENT_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        try:
+            after = _decode_cursor(cursor) if cursor else None
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        # Anti-join: one pass over the user's documents (idx_documents_user_created),
+        # probing the text_documents primary key for each
+        already_associated = exists().where(
+            text_documents.c.text_id == text_id,
+            text_documents.c.document_id == Document.id
+        )
+        query = select(*DOCUMENT_LIST_COLUMNS).where(
+            Document.user_id == current_user.id,
+            ~already_associated
+        ).order_by(Document.created_at.desc(), Document.id.desc()).limit(limit + 1)
         
-        # Filter out already associated documents
-        available_documents = [doc for doc in all_documents if doc.id not in associated_document_ids]
+        if after is not None:
+            query = query.where(tuple_(Document.created_at, Document.id) < tuple_(*after))
         
-        documents_data = []
-        for doc in available_documents:
-            documents_data.append({
-                'id': doc.id,
-                'filename': doc.original_filename,
-                'file_type': doc.file_type,
-                'file_size': doc.file_size,
-                'created_at': doc.created_at.isoformat()
-            })
+        rows = db.session.execute(query).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id)
         
         return jsonify({
             'success': True,
-            'documents': documents_data
+            'documents': [_document_list_item(row) for row in rows],
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
         print(f"Error in get_available_documents_for_text: {str(e)}")
-        return jsonify({'error': 'Failed to fetch available documents'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to fetch available documents'}), 500
+
+@main_bp.route('/api/search', methods=['GET'])
+@login_required
+def search():
+    """Full-text search across the user's documents and texts, best matches first"""
+    try:
+        query_text = request.args.get('q', '').strip()
+        search_type = request.args.get('type', 'all')
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 50)
+        
+        if not query_text:
+            return jsonify({'error': 'Search query is required'}), 400
+        if search_type not in ('all', 'documents', 'texts'):
+            return jsonify({'error': 'Invalid search type'}), 400
+        
+        ts_query = func.websearch_to_tsquery('english', query_text)
+        results = []
+        if search_type in ('all', 'documents'):
+            results += _search_documents(ts_query, query_text, limit)
+        if search_type in ('all', 'texts'):
+            results += _search_texts(ts_query, limit)
+        
+        results.sort(key=lambda result: result['rank'], reverse=True)
+        
+        return jsonify({
+            'success': True,
+            'query': query_text,
+            'results': results[:limit]
+        })
+        
+    except Exception as e:
+        print(f"Error in search: {str(e)}")
+        return jsonify({'error': 'Failed to search'}), 500
+
+# Highlighted passages around the matches, at most two per result. Matches are delimited
+# with control characters and only turned into <mark> tags after the text has been escaped
+SEARCH_MATCH_START = '\x02'
+SEARCH_MATCH_STOP = '\x03'
+SEARCH_HEADLINE_OPTIONS = (
+    f'MaxFragments=2, MinWords=10, MaxWords=30, StartSel={SEARCH_MATCH_START}, StopSel={SEARCH_MATCH_STOP}'
+)
+
+def _snippet_html(headline):
+    """HTML-escape a ts_headline passage, then highlight its matches with <mark> tags"""
+    if not headline:
+        return ''
+    return html.escape(headline).replace(SEARCH_MATCH_START, '<mark>').replace(SEARCH_MATCH_STOP, '</mark>')
+
+def _search_documents(ts_query, query_text, limit):
+    """
+    Rank the user's documents with the GIN index, then build snippets for the top rows only
+
+    Document text is stored compressed, so snippets are highlighted in the
+    retrieval chunk that best matches the query rather than the whole text.
+    """
+    rank = func.ts_rank(Document.search_vector, ts_query)
+    rows = db.session.execute(
+        select(Document.id, Document.original_filename, Document.file_type, rank.label('rank')).where(
+            Document.user_id == current_user.id,
+            Document.search_vector.op('@@')(ts_query)
+        ).order_by(rank.desc()).limit(limit)
+    ).all()
+    
+    chunk_ids = document_retriever.best_chunk_ids([row.id for row in rows], query_text)
+    snippets = dict(db.session.execute(
+        select(
+            DocumentChunk.document_id,
+            func.ts_headline('english', DocumentChunk.content, ts_query, SEARCH_HEADLINE_OPTIONS)
+        ).where(DocumentChunk.id.in_(list(chunk_ids.values())))
+    ).tuples().all()) if chunk_ids else {}
+    
+    return [{
+        'type': 'document',
+        'id': row.id,
+        'title': row.original_filename,
+        'file_type': row.file_type,
+        'snippet': _snippet_html(snippets.get(row.id)),
+        'rank': float(row.rank)
+    } for row in rows]
+
+def _search_texts(ts_query, limit):
+    """Rank the user's texts with the GIN index, then build snippets for the top rows only"""
+    rank = func.ts_rank(Text.search_vector, ts_query)
+    top = select(Text.id, rank.label('rank')).where(
+        Text.user_id == current_user.id,
+        Text.search_vector.op('@@')(ts_query)
+    ).order_by(rank.desc()).limit(limit).subquery()
+    
+    rows = db.session.execute(
+        select(
+            Text.id,
+            Text.title,
+            Text.updated_at,
+            top.c.rank,
+            func.ts_headline('english', func.coalesce(Text.content, ''), ts_query, SEARCH_HEADLINE_OPTIONS).label('snippet')
+        ).join(top, top.c.id == Text.id).order_by(top.c.rank.desc())
+    ).all()
+    
+    return [{
+        'type': 'text',
+        'id': row.id,
+        'title': row.title,
+        'updated_at': row.updated_at.isoformat(),
+        'snippet': _snippet_html(row.snippet),
+        'rank': float(row.rank)
+    } for row in rows]
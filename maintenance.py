@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Periodic database maintenance jobs
+Usage: python maintenance.py expire-trials sweep-tokens sweep-payment-events
+Every job is set-based, works in short transactions and is safe to run at any
+time; schedule them with cron or a Render cron job, e.g. every 15 minutes
+"""
+
+import os
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, func, or_, literal_column
+from dotenv import load_dotenv
+from app import create_app
+from models import db, User, PasswordResetToken, EmailVerificationToken, PaymentEvent
+from identity_cache import identity_cache
+
+load_dotenv()
+
+# Rows per transaction for the sweeps, so no lock is held for long
+BATCH_SIZE = int(os.getenv('MAINTENANCE_BATCH_SIZE', '1000'))
+# Processed webhook events lose their payload after this many days, and are deleted after the second
+PAYMENT_EVENT_PAYLOAD_DAYS = int(os.getenv('PAYMENT_EVENT_PAYLOAD_DAYS', '30'))
+PAYMENT_EVENT_RETENTION_DAYS = int(os.getenv('PAYMENT_EVENT_RETENTION_DAYS', '365'))
+
+def expire_trials() -> dict:
+    """
+    Mark every trial that has ended as trial_expired, in one UPDATE
+
+    Access checks already treat an ended trial as expired from
+    trial_ends_at, so this only brings the stored status in line.
+
+    Returns:
+        Dictionary with the number of users updated
+    """
+    now = datetime.utcnow()
+    user_ids = db.session.execute(
+        update(User)
+        .where(User.subscription_status == 'trial', User.trial_ends_at < now)
+        .values(subscription_status='trial_expired', updated_at=now)
+        .returning(User.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.session.commit()
+
+    # The UPDATE bypasses the ORM events, so tell the app's workers directly
+    identity_cache.invalidate_many(user_ids)
+    return {'rows updated': len(user_ids)}
+
+def sweep_tokens() -> dict:
+    """
+    Delete used and expired password reset and email verification tokens
+
+    Such tokens are rejected on lookup anyway, with the same message as an
+    unknown token.
+
+    Returns:
+        Dictionary with the number of rows deleted and bytes freed
+    """
+    now = datetime.utcnow()
+    totals = {'rows deleted': 0, 'bytes freed': 0}
+    for model in (PasswordResetToken, EmailVerificationToken):
+        result = _sweep_rows(model, or_(model.used.is_(True), model.expires_at < now))
+        for key in totals:
+            totals[key] += result[key]
+    return totals
+
+def sweep_payment_events() -> dict:
+    """
+    Drop old payloads of processed webhook events, then old processed events
+
+    Recent events keep their payload for debugging and every event keeps
+    its stripe_event_id row for deduplication until
+    PAYMENT_EVENT_RETENTION_DAYS; Stripe stops retrying an event after a
+    few days. Unprocessed events are never touched. A value of 0 days
+    disables that step.
+
+    Returns:
+        Dictionary with the payloads cleared, rows deleted and bytes freed
+    """
+    now = datetime.utcnow()
+    totals = {'payloads cleared': 0, 'rows deleted': 0, 'bytes freed': 0}
+
+    if PAYMENT_EVENT_PAYLOAD_DAYS > 0:
+        cutoff = now - timedelta(days=PAYMENT_EVENT_PAYLOAD_DAYS)
+        result = _clear_payloads(PaymentEvent.processed_at < cutoff)
+        totals['payloads cleared'] = result['rows updated']
+        totals['bytes freed'] += result['bytes freed']
+
+    if PAYMENT_EVENT_RETENTION_DAYS > 0:
+        cutoff = now - timedelta(days=PAYMENT_EVENT_RETENTION_DAYS)
+        result = _sweep_rows(PaymentEvent, PaymentEvent.processed_at < cutoff)
+        totals['rows deleted'] = result['rows deleted']
+        totals['bytes freed'] += result['bytes freed']
+
+    return totals
+
+def _sweep_rows(model, condition) -> dict:
+    """
+    Delete the rows matching condition, BATCH_SIZE rows per transaction
+
+    Batches walk the primary key, so each one starts where the last one
+    stopped. Rows locked by a running request are skipped until the next
+    run. Freed bytes are the deleted rows' on-disk size; PostgreSQL reuses
+    the space after autovacuum, without any table lock.
+    """
+    totals = {'rows deleted': 0, 'bytes freed': 0}
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(model.id, func.pg_column_size(literal_column(model.__tablename__)))
+            .where(condition, model.id > last_id)
+            .order_by(model.id)
+            .limit(BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            return totals
+
+        db.session.execute(
+            delete(model)
+            .where(model.id.in_([row[0] for row in rows]))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        totals['rows deleted'] += len(rows)
+        totals['bytes freed'] += sum(row[1] for row in rows)
+        last_id = rows[-1][0]
+
+def _clear_payloads(condition) -> dict:
+    """Set the stored payload of matching payment events to NULL, BATCH_SIZE rows per transaction"""
+    totals = {'rows updated': 0, 'bytes freed': 0}
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(PaymentEvent.id, func.pg_column_size(PaymentEvent.payload))
+            .where(condition, PaymentEvent.payload.isnot(None), PaymentEvent.id > last_id)
+            .order_by(PaymentEvent.id)
+            .limit(BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            return totals
+
+        db.session.execute(
+            update(PaymentEvent)
+            .where(PaymentEvent.id.in_([row[0] for row in rows]))
+            .values(payload=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        totals['rows updated'] += len(rows)
+        totals['bytes freed'] += sum(row[1] for row in rows)
+        last_id = rows[-1][0]
+
+JOBS = {
+    'expire-trials': expire_trials,
+    'sweep-tokens': sweep_tokens,
+    'sweep-payment-events': sweep_payment_events
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('jobs', nargs='+', choices=sorted(JOBS), help='Jobs to run, in order')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        for name in args.jobs:
+            result = JOBS[name]()
+            print(f"✅ {name}: " + ", ".join(f"{value} {label}" for label, value in result.items()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Add precomputed context digest to documents
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Add context digest columns to documents table
+    op.add_column('documents', sa.Column('context_head', sa.Text(), nullable=True))
+    op.add_column('documents', sa.Column('context_tail', sa.Text(), nullable=True))
+    op.add_column('documents', sa.Column('content_length', sa.Integer(), nullable=True))
+
+    # Backfill existing documents (same sizes as DocumentProcessor.DIGEST_*_CHARS)
+    op.execute("""
+        UPDATE documents
+        SET context_head = left(stripped, 4500),
+            context_tail = right(stripped, 2250),
+            content_length = length(stripped)
+        FROM (
+            SELECT id AS doc_id, btrim(content_text, E' \\t\\n\\r\\f') AS stripped
+            FROM documents
+            WHERE content_text IS NOT NULL
+        ) AS source
+        WHERE documents.id = source.doc_id
+    """)
+
+
+def downgrade():
+    # Remove context digest columns from documents table
+    op.drop_column('documents', 'content_length')
+    op.drop_column('documents', 'context_tail')
+    op.drop_column('documents', 'context_head')
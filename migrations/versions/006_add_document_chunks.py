@@ -0,0 +1,58 @@
+"""Add document chunks and inverted index for relevance-ranked AI context
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Retrieval index statistics on documents (NULL = not indexed yet)
+    op.add_column('documents', sa.Column('chunk_count', sa.Integer(), nullable=True))
+    op.add_column('documents', sa.Column('token_count', sa.Integer(), nullable=True))
+
+    # Create document_chunks table (create_tables.py may already have created it)
+    if not sa.inspect(op.get_bind()).has_table('document_chunks'):
+        op.create_table('document_chunks',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('document_id', sa.Integer(), nullable=False),
+            sa.Column('position', sa.Integer(), nullable=False),
+            sa.Column('content', sa.Text(), nullable=False),
+            sa.Column('length', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_document_chunks_document_id'), 'document_chunks', ['document_id'])
+
+    # Create document_chunk_terms table (inverted index)
+    if not sa.inspect(op.get_bind()).has_table('document_chunk_terms'):
+        op.create_table('document_chunk_terms',
+            sa.Column('term', sa.String(64), nullable=False),
+            sa.Column('chunk_id', sa.Integer(), nullable=False),
+            sa.Column('document_id', sa.Integer(), nullable=False),
+            sa.Column('tf', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['chunk_id'], ['document_chunks.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('term', 'chunk_id')
+        )
+        op.create_index('idx_document_chunk_terms_document_term', 'document_chunk_terms', ['document_id', 'term'])
+
+
+def downgrade():
+    # Drop tables
+    op.drop_table('document_chunk_terms')
+    op.drop_table('document_chunks')
+
+    # Remove columns from documents table
+    op.drop_column('documents', 'token_count')
+    op.drop_column('documents', 'chunk_count')
@@ -0,0 +1,53 @@
+"""Add full-text search vectors to documents and texts
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Generated tsvector columns (PostgreSQL computes them on insert/update, existing rows included)
+    op.add_column('documents', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('english', coalesce(original_filename, '')), 'A') || "
+            "setweight(to_tsvector('english', left(coalesce(content_text, ''), 1000000)), 'B')",
+            persisted=True
+        )
+    ))
+    op.add_column('texts', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('english', left(coalesce(content, ''), 1000000)), 'B')",
+            persisted=True
+        )
+    ))
+
+    # GIN indexes for @@ queries
+    op.create_index('idx_documents_search_vector', 'documents', ['search_vector'], postgresql_using='gin')
+    op.create_index('idx_texts_search_vector', 'texts', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade():
+    # Drop indexes
+    op.drop_index('idx_texts_search_vector', table_name='texts')
+    op.drop_index('idx_documents_search_vector', table_name='documents')
+
+    # Remove search vector columns
+    op.drop_column('texts', 'search_vector')
+    op.drop_column('documents', 'search_vector')
@@ -0,0 +1,28 @@
+"""Add upload pipeline status to documents
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing documents were processed synchronously, so they are ready
+    op.add_column('documents', sa.Column('status', sa.String(20), nullable=False, server_default='ready'))
+    op.add_column('documents', sa.Column('error_message', sa.String(255), nullable=True))
+
+
+def downgrade():
+    # Remove status columns from documents table
+    op.drop_column('documents', 'error_message')
+    op.drop_column('documents', 'status')
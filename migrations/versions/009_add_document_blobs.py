@@ -0,0 +1,50 @@
+"""Add content-hash deduplicated document blobs
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Create document_blobs table (create_tables.py may already have created it)
+    if not sa.inspect(op.get_bind()).has_table('document_blobs'):
+        op.create_table('document_blobs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('sha256', sa.String(64), nullable=False),
+            sa.Column('file_type', sa.String(10), nullable=False),
+            sa.Column('file_size', sa.Integer(), nullable=False),
+            sa.Column('upload_path', sa.String(500), nullable=True),
+            sa.Column('cloudinary_public_id', sa.String(255), nullable=True),
+            sa.Column('cloudinary_url', sa.String(500), nullable=True),
+            sa.Column('cloudinary_secure_url', sa.String(500), nullable=True),
+            sa.Column('ref_count', sa.Integer(), nullable=False, server_default='1'),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('sha256')
+        )
+
+    # Reference from documents (existing documents keep their own storage)
+    op.add_column('documents', sa.Column('blob_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('fk_documents_blob_id', 'documents', 'document_blobs', ['blob_id'], ['id'])
+    op.create_index(op.f('ix_documents_blob_id'), 'documents', ['blob_id'])
+
+
+def downgrade():
+    # Remove blob reference from documents table
+    op.drop_index(op.f('ix_documents_blob_id'), table_name='documents')
+    op.drop_constraint('fk_documents_blob_id', 'documents', type_='foreignkey')
+    op.drop_column('documents', 'blob_id')
+
+    # Drop tables
+    op.drop_table('document_blobs')
@@ -0,0 +1,46 @@
+"""Add composite indexes for per-user access patterns
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Per-user listings, newest first (id breaks ties for keyset pagination)
+    op.create_index('idx_texts_user_updated', 'texts',
+                    ['user_id', sa.text('updated_at DESC'), sa.text('id DESC')])
+    op.create_index('idx_documents_user_created', 'documents',
+                    ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+                    postgresql_include=['original_filename', 'file_type', 'file_size'])
+
+    # Active subscription lookup
+    op.create_index('idx_subscriptions_user_active', 'subscriptions', ['user_id'],
+                    postgresql_where=sa.text("status = 'active'"))
+
+    # Document side of the text/document association (text side is the primary key)
+    op.create_index('idx_text_documents_document_id', 'text_documents', ['document_id'])
+
+    # Webhook lookups and per-user cascades
+    op.create_index(op.f('ix_users_stripe_customer_id'), 'users', ['stripe_customer_id'])
+    op.create_index(op.f('ix_payment_events_user_id'), 'payment_events', ['user_id'])
+
+
+def downgrade():
+    # Drop indexes
+    op.drop_index(op.f('ix_payment_events_user_id'), table_name='payment_events')
+    op.drop_index(op.f('ix_users_stripe_customer_id'), table_name='users')
+    op.drop_index('idx_text_documents_document_id', table_name='text_documents')
+    op.drop_index('idx_subscriptions_user_active', table_name='subscriptions')
+    op.drop_index('idx_documents_user_created', table_name='documents')
+    op.drop_index('idx_texts_user_updated', table_name='texts')
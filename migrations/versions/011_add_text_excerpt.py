@@ -0,0 +1,41 @@
+"""Add text excerpt for lightweight listings
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Add excerpt column to texts table
+    op.add_column('texts', sa.Column('excerpt', sa.String(length=200), nullable=True))
+
+    # Backfill existing texts the same way models.make_excerpt does
+    op.execute("""
+        UPDATE texts
+        SET excerpt = CASE
+            WHEN length(collapsed) <= 200 THEN collapsed
+            ELSE rtrim(left(collapsed, 197)) || '...'
+        END
+        FROM (
+            SELECT id AS text_id,
+                   regexp_replace(btrim(coalesce(content, ''), E' \\t\\n\\r\\f\\v'), '\\s+', ' ', 'g') AS collapsed
+            FROM texts
+        ) AS source
+        WHERE texts.id = source.text_id
+    """)
+
+
+def downgrade():
+    # Remove excerpt column from texts table
+    op.drop_column('texts', 'excerpt')
@@ -0,0 +1,108 @@
+"""Move extracted document text into compressed document_contents
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-17
+
+"""
+import zlib
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 100
+
+
+def upgrade():
+    # Create document_contents table (create_tables.py may already have created it)
+    if not sa.inspect(op.get_bind()).has_table('document_contents'):
+        op.create_table('document_contents',
+            sa.Column('document_id', sa.Integer(), nullable=False),
+            sa.Column('compression', sa.String(length=10), nullable=False),
+            sa.Column('data', sa.LargeBinary(), nullable=False),
+            sa.Column('original_size', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('document_id')
+        )
+
+    # Copy the extracted text over, zlib-compressed, in batches
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text(
+            "SELECT id, content_text, created_at FROM documents "
+            "WHERE id > :last_id AND content_text IS NOT NULL ORDER BY id LIMIT :batch_size"
+        ), {'last_id': last_id, 'batch_size': BATCH_SIZE}).all()
+        if not rows:
+            break
+
+        values = []
+        for row in rows:
+            raw = row.content_text.encode('utf-8')
+            values.append({
+                'document_id': row.id,
+                'compression': 'zlib',
+                'data': zlib.compress(raw, 6),
+                'original_size': len(raw),
+                'created_at': row.created_at
+            })
+        connection.execute(sa.text(
+            "INSERT INTO document_contents (document_id, compression, data, original_size, created_at) "
+            "VALUES (:document_id, :compression, :data, :original_size, :created_at) "
+            "ON CONFLICT (document_id) DO NOTHING"
+        ), values)
+        last_id = rows[-1].id
+
+    # Keep the search vectors computed so far, now written by the application
+    op.execute("ALTER TABLE documents ALTER COLUMN search_vector DROP EXPRESSION")
+
+    # Remove content_text column from documents table
+    op.drop_column('documents', 'content_text')
+
+
+def downgrade():
+    # Add content_text column back to documents table
+    op.add_column('documents', sa.Column('content_text', sa.Text(), nullable=True))
+
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text(
+            "SELECT document_id, compression, data FROM document_contents "
+            "WHERE document_id > :last_id ORDER BY document_id LIMIT :batch_size"
+        ), {'last_id': last_id, 'batch_size': BATCH_SIZE}).all()
+        if not rows:
+            break
+
+        values = []
+        for row in rows:
+            data = zlib.decompress(row.data) if row.compression == 'zlib' else bytes(row.data)
+            values.append({'document_id': row.document_id, 'content_text': data.decode('utf-8')})
+        connection.execute(sa.text(
+            "UPDATE documents SET content_text = :content_text WHERE id = :document_id"
+        ), values)
+        last_id = rows[-1].document_id
+
+    # Recreate the generated search vector (dropping the column drops its index)
+    op.drop_column('documents', 'search_vector')
+    op.add_column('documents', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed(
+            "setweight(to_tsvector('english', coalesce(original_filename, '')), 'A') || "
+            "setweight(to_tsvector('english', left(coalesce(content_text, ''), 1000000)), 'B')",
+            persisted=True
+        )
+    ))
+    op.create_index('idx_documents_search_vector', 'documents', ['search_vector'], postgresql_using='gin')
+
+    # Drop document_contents table
+    op.drop_table('document_contents')
@@ -0,0 +1,27 @@
+"""Add partial index for the trial expiry job
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Trials still marked active (the expiry job's UPDATE reads only these)
+    op.create_index('idx_users_trial_ends_at', 'users', ['trial_ends_at'],
+                    postgresql_where=sa.text("subscription_status = 'trial'"))
+
+
+def downgrade():
+    # Drop index
+    op.drop_index('idx_users_trial_ends_at', table_name='users')
@@ -0,0 +1,50 @@
+"""Add per-user usage counters
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Create user_usage table (create_tables.py may already have created it)
+    if not sa.inspect(op.get_bind()).has_table('user_usage'):
+        op.create_table('user_usage',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('text_count', sa.Integer(), server_default='0', nullable=False),
+            sa.Column('document_count', sa.Integer(), server_default='0', nullable=False),
+            sa.Column('ai_request_date', sa.Date(), nullable=True),
+            sa.Column('ai_request_count', sa.Integer(), server_default='0', nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('user_id')
+        )
+
+    # Start every existing user from their current totals, replacing counts kept since create_tables.py
+    op.execute("""
+        INSERT INTO user_usage (user_id, text_count, document_count, updated_at)
+        SELECT users.id,
+               (SELECT count(*) FROM texts WHERE texts.user_id = users.id),
+               (SELECT count(*) FROM documents WHERE documents.user_id = users.id),
+               now()
+        FROM users
+        ON CONFLICT (user_id) DO UPDATE
+        SET text_count = EXCLUDED.text_count,
+            document_count = EXCLUDED.document_count,
+            updated_at = EXCLUDED.updated_at
+    """)
+
+
+def downgrade():
+    # Drop user_usage table
+    op.drop_table('user_usage')
@@ -0,0 +1,97 @@
+"""Store payment event summaries and compressed payloads instead of full JSON
+
+Revision ID: 015
+Revises: 014
+Create Date: 2026-10-17
+
+"""
+import json
+import zlib
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '015'
+down_revision = '014'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 100
+
+# Copy of StripeService.EVENT_SUMMARY_FIELDS at the time of this migration
+EVENT_SUMMARY_FIELDS = {
+    'checkout.session.completed': ('customer', 'subscription', 'metadata'),
+    'customer.subscription.updated': ('customer', 'status', 'current_period_start', 'current_period_end', 'canceled_at'),
+    'customer.subscription.deleted': ('customer', 'status', 'current_period_start', 'current_period_end', 'canceled_at'),
+    'invoice.payment_failed': ('customer', 'subscription')
+}
+
+
+def upgrade():
+    # Add compact columns to payment_events table
+    op.add_column('payment_events', sa.Column('object_id', sa.String(length=255), nullable=True))
+    op.add_column('payment_events', sa.Column('summary', sa.JSON(), nullable=True))
+    op.add_column('payment_events', sa.Column('payload', sa.LargeBinary(), nullable=True))
+
+    # Summarize existing events and keep their data as a compressed event body, in batches
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text(
+            "SELECT id, stripe_event_id, event_type, data FROM payment_events "
+            "WHERE id > :last_id ORDER BY id LIMIT :batch_size"
+        ), {'last_id': last_id, 'batch_size': BATCH_SIZE}).all()
+        if not rows:
+            break
+
+        values = []
+        for row in rows:
+            data = row.data or {}
+            event_object = data.get('object') or {}
+            summary = {field: event_object.get(field) for field in EVENT_SUMMARY_FIELDS.get(row.event_type, ())}
+            body = json.dumps({'id': row.stripe_event_id, 'type': row.event_type, 'data': data})
+            values.append({
+                'id': row.id,
+                'object_id': event_object.get('id'),
+                'summary': json.dumps(summary),
+                'payload': zlib.compress(body.encode('utf-8'), 6) if row.data is not None else None
+            })
+        connection.execute(sa.text(
+            "UPDATE payment_events SET object_id = :object_id, summary = CAST(:summary AS json), payload = :payload "
+            "WHERE id = :id"
+        ), values)
+        last_id = rows[-1].id
+
+    # Remove data column from payment_events table
+    op.drop_column('payment_events', 'data')
+
+
+def downgrade():
+    # Add data column back to payment_events table
+    op.add_column('payment_events', sa.Column('data', sa.JSON(), nullable=True))
+
+    # Restore data from the stored payloads (events whose payload was cleared stay empty)
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(sa.text(
+            "SELECT id, payload FROM payment_events "
+            "WHERE id > :last_id AND payload IS NOT NULL ORDER BY id LIMIT :batch_size"
+        ), {'last_id': last_id, 'batch_size': BATCH_SIZE}).all()
+        if not rows:
+            break
+
+        values = []
+        for row in rows:
+            event = json.loads(zlib.decompress(row.payload).decode('utf-8'))
+            values.append({'id': row.id, 'data': json.dumps(event.get('data'))})
+        connection.execute(sa.text(
+            "UPDATE payment_events SET data = CAST(:data AS json) WHERE id = :id"
+        ), values)
+        last_id = rows[-1].id
+
+    # Remove compact columns from payment_events table
+    op.drop_column('payment_events', 'payload')
+    op.drop_column('payment_events', 'summary')
+    op.drop_column('payment_events', 'object_id')
@@ -0,0 +1,41 @@
+"""Persist upload jobs on their documents
+
+Revision ID: 016
+Revises: 015
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '016'
+down_revision = '015'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Add upload job columns to documents table
+    op.add_column('documents', sa.Column('claimed_at', sa.DateTime(), nullable=True))
+    op.add_column('documents', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('documents', sa.Column('upload_sha256', sa.String(length=64), nullable=True))
+    op.add_column('documents', sa.Column('staged_path', sa.String(length=500), nullable=True))
+    op.add_column('documents', sa.Column('staged_data', sa.LargeBinary(), nullable=True))
+
+    # Queued and running upload jobs (the pipeline's claim query reads only these)
+    op.create_index('idx_documents_claimed_at', 'documents', ['claimed_at'],
+                    postgresql_where=sa.text("status = 'processing'"))
+
+
+def downgrade():
+    # Drop index
+    op.drop_index('idx_documents_claimed_at', table_name='documents')
+
+    # Remove upload job columns from documents table
+    op.drop_column('documents', 'staged_data')
+    op.drop_column('documents', 'staged_path')
+    op.drop_column('documents', 'upload_sha256')
+    op.drop_column('documents', 'attempts')
+    op.drop_column('documents', 'claimed_at')
@@ -0,0 +1,52 @@
+"""Move staged upload bytes off the documents table
+
+Revision ID: 017
+Revises: 016
+Create Date: 2026-10-17
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '017'
+down_revision = '016'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Create staged_uploads table (create_tables.py may already have created it)
+    if not sa.inspect(op.get_bind()).has_table('staged_uploads'):
+        op.create_table('staged_uploads',
+            sa.Column('document_id', sa.Integer(), nullable=False),
+            sa.Column('data', sa.LargeBinary(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint('document_id')
+        )
+
+    # Move the bytes of uploads still waiting to be processed
+    op.execute("""
+        INSERT INTO staged_uploads (document_id, data, created_at)
+        SELECT id, staged_data, now() FROM documents
+        WHERE staged_data IS NOT NULL
+        ON CONFLICT (document_id) DO NOTHING
+    """)
+
+    # Remove staged_data column from documents table
+    op.drop_column('documents', 'staged_data')
+
+
+def downgrade():
+    # Add staged_data column back to documents table
+    op.add_column('documents', sa.Column('staged_data', sa.LargeBinary(), nullable=True))
+
+    op.execute("""
+        UPDATE documents SET staged_data = staged_uploads.data
+        FROM staged_uploads WHERE staged_uploads.document_id = documents.id
+    """)
+
+    # Drop staged_uploads table
+    op.drop_table('staged_uploads')
@@ -1,11 +1,32 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, validates
 from datetime import datetime, timedelta
 import bcrypt
 import secrets
 
 db = SQLAlchemy()
 
+# Generated full-text search vector (titles rank above body text). The body is capped
+# so very large texts stay under PostgreSQL's 1 MB tsvector limit. Documents keep their
+# text compressed in document_contents, so their vector is written by ContentStore.
+TEXT_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', left(coalesce(content, ''), 1000000)), 'B')"
+)
+
+# Length of the plain-text preview stored with each text for listings
+TEXT_EXCERPT_LENGTH = 200
+
+def make_excerpt(content, length: int = TEXT_EXCERPT_LENGTH) -> str:
+    """Collapse whitespace and cut content down to a short preview"""
+    collapsed = ' '.join((content or '').split())
+    if len(collapsed) <= length:
+        return collapsed
+    return collapsed[:length - 3].rstrip() + '...'
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
@@ -22,7 +43,7 @@ class User(UserMixin, db.Model):
     # Subscription fields
     subscription_status = db.Column(db.String(20), nullable=False, default='trial')  # trial, active, past_due, canceled, incomplete
     subscription_plan = db.Column(db.String(20), nullable=True)  # monthly, annual
-    stripe_customer_id = db.Column(db.String(100), nullable=True)
+    stripe_customer_id = db.Column(db.String(100), nullable=True, index=True)  # Webhooks look users up by customer
     trial_ends_at = db.Column(db.DateTime, nullable=True)
     subscription_ends_at = db.Column(db.DateTime, nullable=True)
     
@@ -87,12 +108,20 @@ class User(UserMixin, db.Model):
         return (self.trial_ends_at - datetime.utcnow()).days
     
     def get_current_subscription(self):
-        """Get the current active subscription"""
-        return self.subscriptions.filter_by(status='active').first()
+        """Get the current active subscription (looked up once until the user is expired or refreshed)"""
+        if '_current_subscription' not in self.__dict__:
+            self._current_subscription = self.subscriptions.filter_by(status='active').first()
+        return self._current_subscription
     
     def __repr__(self):
         return f'<User {self.email}>'
 
+@event.listens_for(User, 'expire')
+@event.listens_for(User, 'refresh')
+def _forget_current_subscription(user, *args):
+    """Drop the memoized subscription whenever the user's own state is reloaded (e.g. after a commit)"""
+    user.__dict__.pop('_current_subscription', None)
+
 class PasswordResetToken(db.Model):
     __tablename__ = 'password_reset_tokens'
     
@@ -141,6 +170,9 @@ class EmailVerificationToken(db.Model):
 
 class Document(db.Model):
     __tablename__ = 'documents'
+    __table_args__ = (
+        db.Index('idx_documents_search_vector', 'search_vector', postgresql_using='gin'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -148,7 +180,29 @@ class Document(db.Model):
     original_filename = db.Column(db.String(255), nullable=False)
     file_type = db.Column(db.String(10), nullable=False)  # 'pdf' or 'docx'
     file_size = db.Column(db.Integer, nullable=False)
-    content_text = db.Column(db.Text, nullable=True)  # Extracted text content
+    
+    # Shared stored file and extraction result (NULL for documents uploaded before deduplication)
+    blob_id = db.Column(db.Integer, db.ForeignKey('document_blobs.id'), nullable=True, index=True)
+    
+    # Upload pipeline state: processing, ready or failed
+    status = db.Column(db.String(20), nullable=False, default='ready', server_default='ready')
+    error_message = db.Column(db.String(255), nullable=True)
+    
+    # Upload job, persisted so a restart or deploy does not lose it (see UploadPipeline)
+    claimed_at = db.Column(db.DateTime, nullable=True)  # When a pipeline worker last took the job
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    upload_sha256 = db.Column(db.String(64), nullable=True)
+    staged_path = db.Column(db.String(500), nullable=True)  # Temp file of a large upload (small ones: StagedUpload)
+    
+    # Context digest computed once at upload, so AI requests never read the full text
+    context_head = db.Column(db.Text, nullable=True)  # Beginning of the stripped text
+    context_tail = db.Column(db.Text, nullable=True)  # End of the stripped text
+    content_length = db.Column(db.Integer, nullable=True)  # Length of the stripped text
+    
+    # Retrieval index statistics (NULL until the document has been chunked and indexed)
+    chunk_count = db.Column(db.Integer, nullable=True)
+    token_count = db.Column(db.Integer, nullable=True)
+    
     upload_path = db.Column(db.String(500), nullable=True)  # Local path for backward compatibility
     
     # Cloudinary fields
@@ -156,13 +210,39 @@ class Document(db.Model):
     cloudinary_url = db.Column(db.String(500), nullable=True)
     cloudinary_secure_url = db.Column(db.String(500), nullable=True)
     
+    # Full-text search vector written with the extracted text, only loaded when asked for
+    search_vector = deferred(db.Column(TSVECTOR, nullable=True))
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Extracted text lives in its own table (see ContentStore), loaded only when asked for
+    content = db.relationship('DocumentContent', uselist=False, lazy='select',
+                              cascade='all, delete-orphan', passive_deletes=True)
+    
+    # Chunks are removed by the database (ON DELETE CASCADE) together with their index terms
+    chunks = db.relationship('DocumentChunk', backref='document', lazy='dynamic',
+                             cascade='all, delete-orphan', passive_deletes=True)
+    
     @property
     def is_cloudinary_stored(self):
         """Check if document is stored in Cloudinary"""
         return bool(self.cloudinary_public_id and self.cloudinary_secure_url)
     
+    @property
+    def has_context_digest(self):
+        """Check if the context digest has been computed for this document"""
+        return self.content_length is not None
+    
+    @property
+    def is_ready(self):
+        """Check if the upload pipeline has finished processing this document"""
+        return self.status == 'ready'
+    
+    @property
+    def is_indexed(self):
+        """Check if the document has been chunked for relevance-ranked retrieval"""
+        return self.chunk_count is not None
+    
     @property
     def file_url(self):
         """Get file URL - prefer Cloudinary secure URL"""
@@ -173,29 +253,121 @@ class Document(db.Model):
     def __repr__(self):
         return f'<Document {self.original_filename}>'
 
+class DocumentContent(db.Model):
+    __tablename__ = 'document_contents'
+    
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True)
+    compression = db.Column(db.String(10), nullable=False)  # 'zlib' or 'none'
+    data = db.Column(db.LargeBinary, nullable=False)  # UTF-8 extracted text, compressed as above
+    original_size = db.Column(db.Integer, nullable=False)  # Uncompressed size in bytes
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DocumentContent {self.document_id} {self.compression}>'
+
+class StagedUpload(db.Model):
+    __tablename__ = 'staged_uploads'
+    
+    # Bytes of a small upload waiting for the upload pipeline, kept off the documents row
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<StagedUpload {self.document_id}>'
+
+class DocumentBlob(db.Model):
+    __tablename__ = 'document_blobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)  # Content fingerprint of the uploaded file
+    file_type = db.Column(db.String(10), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+    
+    # Where the single stored copy lives
+    upload_path = db.Column(db.String(500), nullable=True)
+    cloudinary_public_id = db.Column(db.String(255), nullable=True)
+    cloudinary_url = db.Column(db.String(500), nullable=True)
+    cloudinary_secure_url = db.Column(db.String(500), nullable=True)
+    
+    ref_count = db.Column(db.Integer, nullable=False, default=1)  # Documents referencing this blob
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    documents = db.relationship('Document', backref='blob', lazy='dynamic')
+    
+    def __repr__(self):
+        return f'<DocumentBlob {self.sha256[:12]} refs={self.ref_count}>'
+
+class DocumentChunk(db.Model):
+    __tablename__ = 'document_chunks'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)  # Order of the chunk within the document
+    content = db.Column(db.Text, nullable=False)
+    length = db.Column(db.Integer, nullable=False)  # Number of index terms in the chunk
+    
+    def __repr__(self):
+        return f'<DocumentChunk {self.document_id}:{self.position}>'
+
+# Inverted index: term frequencies per chunk, looked up by (document_id, term)
+document_chunk_terms = db.Table('document_chunk_terms',
+    db.Column('term', db.String(64), primary_key=True),
+    db.Column('chunk_id', db.Integer, db.ForeignKey('document_chunks.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('document_id', db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False),
+    db.Column('tf', db.Integer, nullable=False),
+    db.Index('idx_document_chunk_terms_document_term', 'document_id', 'term')
+)
+
 # Association table for Text-Document many-to-many relationship
 text_documents = db.Table('text_documents',
     db.Column('text_id', db.Integer, db.ForeignKey('texts.id'), primary_key=True),
     db.Column('document_id', db.Integer, db.ForeignKey('documents.id'), primary_key=True),
-    db.Column('created_at', db.DateTime, default=datetime.utcnow)
+    db.Column('created_at', db.DateTime, default=datetime.utcnow),
+    # The primary key covers lookups by text; this covers lookups by document
+    db.Index('idx_text_documents_document_id', 'document_id')
 )
 
 class Text(db.Model):
     __tablename__ = 'texts'
+    __table_args__ = (
+        db.Index('idx_texts_search_vector', 'search_vector', postgresql_using='gin'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     title = db.Column(db.String(255), nullable=False)
-    content = db.Column(db.Text, nullable=True)
+    # Only loaded for the editor (undefer it there); listings use the excerpt
+    content = deferred(db.Column(db.Text, nullable=True))
+    excerpt = db.Column(db.String(TEXT_EXCERPT_LENGTH), nullable=True)  # Kept in sync with content
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Full-text search vector maintained by PostgreSQL, only loaded when asked for
+    search_vector = deferred(db.Column(TSVECTOR, db.Computed(TEXT_SEARCH_VECTOR, persisted=True)))
+    
     # Many-to-many relationship with documents
     documents = db.relationship('Document', secondary=text_documents, backref='texts', lazy='dynamic')
     
+    @validates('content')
+    def _update_excerpt(self, key, content):
+        self.excerpt = make_excerpt(content)
+        return content
+    
     def __repr__(self):
         return f'<Text {self.title}>'
 
+# Trials still marked active, for the periodic expiry job
+db.Index('idx_users_trial_ends_at', User.trial_ends_at, postgresql_where=(User.subscription_status == 'trial'))
+
+# Per-user listings, newest first (id breaks ties for keyset pagination)
+db.Index('idx_texts_user_updated', Text.user_id, Text.updated_at.desc(), Text.id.desc())
+db.Index('idx_documents_user_created', Document.user_id, Document.created_at.desc(), Document.id.desc(),
+         postgresql_include=['original_filename', 'file_type', 'file_size'])
+
+# Queued and running upload jobs, for the upload pipeline's claim query
+db.Index('idx_documents_claimed_at', Document.claimed_at, postgresql_where=(Document.status == 'processing'))
+
 class Subscription(db.Model):
     __tablename__ = 'subscriptions'
     
@@ -238,14 +410,35 @@ class Subscription(db.Model):
     def __repr__(self):
         return f'<Subscription {self.stripe_subscription_id}>'
 
+# User.get_current_subscription only ever looks for the active subscription
+db.Index('idx_subscriptions_user_active', Subscription.user_id, postgresql_where=(Subscription.status == 'active'))
+
+class UserUsage(db.Model):
+    __tablename__ = 'user_usage'
+    
+    # One row per user, updated atomically together with the writes it counts (see UsageLimits)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    text_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    document_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    ai_request_date = db.Column(db.Date, nullable=True)  # UTC day that ai_request_count refers to
+    ai_request_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UserUsage {self.user_id}>'
+
 class PaymentEvent(db.Model):
     __tablename__ = 'payment_events'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)  # Nullable for system events
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)  # Nullable for system events
+    # Webhook deduplication looks events up by this unique btree (a hash index cannot be unique)
     stripe_event_id = db.Column(db.String(100), nullable=False, unique=True)
     event_type = db.Column(db.String(50), nullable=False)
-    data = db.Column(db.JSON, nullable=True)  # Store event data for debugging
+    object_id = db.Column(db.String(255), nullable=True)  # Stripe id of the event's object
+    summary = db.Column(db.JSON, nullable=True)  # Only the object fields the webhook handlers use
+    # zlib-compressed raw webhook body, for debugging; optional and cleared after a retention period
+    payload = deferred(db.Column(db.LargeBinary, nullable=True))
     processed_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
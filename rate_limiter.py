@@ -0,0 +1,347 @@
+import os
+import math
+import time
+import socket
+import sqlite3
+import tempfile
+import threading
+from contextlib import closing
+from collections import OrderedDict
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def sliding_window(state: Optional[tuple], now: float, limit: int, per_seconds: float) -> Tuple[bool, tuple, float]:
+    """
+    Sliding window counter step shared by the backends
+
+    Only the counts of the current and the previous fixed window are kept;
+    the previous window's count is weighted by how much of it still
+    overlaps the sliding window. That is O(1) state per key, instead of
+    one timestamp per request.
+
+    Args:
+        state: (window_index, current_count, previous_count), or None for a new key
+        now: Current time in seconds
+        limit: Maximum requests per window
+        per_seconds: Window length in seconds
+
+    Returns:
+        Tuple of (allowed, new_state, retry_after_seconds)
+    """
+    window_index = int(now // per_seconds)
+    current = previous = 0
+    if state is not None:
+        stored_index, stored_current, stored_previous = state
+        if stored_index == window_index:
+            current, previous = stored_current, stored_previous
+        elif stored_index == window_index - 1:
+            previous = stored_current
+
+    elapsed = now - window_index * per_seconds
+    weight = 1 - elapsed / per_seconds
+    if previous * weight + current + 1 <= limit:
+        return True, (window_index, current + 1, previous), 0.0
+
+    return False, (window_index, current, previous), _retry_after(current, previous, weight, limit, per_seconds)
+
+def _retry_after(current: int, previous: int, weight: float, limit: int, per_seconds: float) -> float:
+    """Seconds until one more request fits in the window"""
+    if current + 1 > limit or previous == 0:
+        # Only the next window helps
+        return per_seconds * weight
+    # Wait until enough of the previous window has slid out
+    return max(0.0, per_seconds * (weight - (limit - current - 1) / previous))
+
+class MemoryRateLimitBackend:
+    """In-process sliding window counters, evicting the least recently used keys beyond max_keys"""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._entries = OrderedDict()  # key -> (window_index, current_count, previous_count)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def hit(self, key: str, limit: int, per_seconds: float) -> Tuple[bool, float]:
+        with self._lock:
+            allowed, state, retry_after = sliding_window(self._entries.get(key), time.time(), limit, per_seconds)
+            self._entries[key] = state
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+            return allowed, retry_after
+
+class SQLiteRateLimitBackend:
+    """
+    Sliding window counters in a local SQLite file, shared by every worker process on the host
+
+    Keys whose windows have passed are deleted as they expire; beyond
+    max_keys the least recently used keys are evicted.
+    """
+
+    # How often (in hits per process) to enforce max_keys
+    EVICTION_INTERVAL = 256
+
+    def __init__(self, path: str, max_keys: int = 10000):
+        self.path = path
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._hits = 0
+        self._local = threading.local()
+
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    key TEXT PRIMARY KEY,
+                    window_index INTEGER NOT NULL,
+                    current_count INTEGER NOT NULL,
+                    previous_count INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limits_expires_at ON rate_limits (expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_rate_limits_accessed_at ON rate_limits (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode, so transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        # Counters may lose their last writes on power loss, never their consistency (WAL)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Get this thread's connection, reopened after a fork
+
+        Kept open because closing the last connection to the file checkpoints the WAL.
+        """
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def hit(self, key: str, limit: int, per_seconds: float) -> Tuple[bool, float]:
+        now = time.time()
+        self._hits += 1
+        conn = self._connection()
+        # Take the write lock up front so concurrent workers cannot both read the same count
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT window_index, current_count, previous_count FROM rate_limits WHERE key = ?", (key,)
+            ).fetchone()
+            allowed, state, retry_after = sliding_window(row, now, limit, per_seconds)
+
+            # The state means nothing once both of its windows have passed
+            expires_at = (state[0] + 2) * per_seconds
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits "
+                "(key, window_index, current_count, previous_count, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, state[0], state[1], state[2], expires_at, now)
+            )
+            conn.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,))
+
+            if self._hits % self.EVICTION_INTERVAL == 0:
+                self._evict(conn)
+
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return allowed, retry_after
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Delete the least recently used keys beyond max_keys"""
+        excess = conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0] - self.max_keys
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM rate_limits WHERE key IN "
+                "(SELECT key FROM rate_limits ORDER BY accessed_at LIMIT ?)", (excess,)
+            )
+            self.evictions += excess
+
+class RespClient:
+    """
+    Minimal client for a Redis-protocol server: pipelined commands over one connection per thread
+
+    Redis, Valkey, KeyDB or any small stand-in that speaks RESP will do.
+    """
+
+    def __init__(self, url: str, timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def execute(self, *commands) -> list:
+        """Send commands in one pipeline and return their replies, reconnecting once on a broken connection"""
+        for attempt in range(2):
+            try:
+                sock, stream = self._connection()
+                sock.sendall(b''.join(self._encode(command) for command in commands))
+                return [self._read_reply(stream) for _ in commands]
+            except OSError:  # Includes connection errors and timeouts
+                self._close()
+                if attempt:
+                    raise
+
+    def _connection(self):
+        """Get this thread's connection, opening (and authenticating) it if needed"""
+        if getattr(self._local, 'sock', None) is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # Small pipelined requests
+            self._local.sock, self._local.stream = sock, sock.makefile('rb')
+            setup = []
+            if self.password:
+                setup.append(('AUTH', self.password))
+            if self.db:
+                setup.append(('SELECT', self.db))
+            if setup:
+                sock.sendall(b''.join(self._encode(command) for command in setup))
+                for _ in setup:
+                    self._read_reply(self._local.stream)
+        return self._local.sock, self._local.stream
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = self._local.stream = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _encode(self, args) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            value = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(value), value))
+        return b''.join(parts)
+
+    def _read_reply(self, stream):
+        """Parse one RESP reply"""
+        line = stream.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by Redis-protocol server")
+
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            raise RuntimeError(f"Redis-protocol server error: {payload.decode('utf-8')}")
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            return None if length < 0 else stream.read(length + 2)[:-2].decode('utf-8')
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read_reply(stream) for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from Redis-protocol server: {line!r}")
+
+class RedisRateLimitBackend:
+    """
+    Sliding window counters in a Redis-protocol server, shared by every worker and instance
+
+    Each fixed window is one counter key that expires on its own, so the
+    server does the eviction. Only INCR, DECR, EXPIRE and GET are used,
+    pipelined in one round trip.
+    """
+
+    def __init__(self, url: str, timeout: float = 1.0, prefix: str = 'writify:ratelimit:'):
+        self.client = RespClient(url, timeout=timeout)
+        self.prefix = prefix
+
+    def hit(self, key: str, limit: int, per_seconds: float) -> Tuple[bool, float]:
+        now = time.time()
+        window_index = int(now // per_seconds)
+        current_key = f"{self.prefix}{key}:{window_index}"
+        previous_key = f"{self.prefix}{key}:{window_index - 1}"
+
+        # Count first, then check; a denied request takes its count back
+        current, _, previous = self.client.execute(
+            ('INCR', current_key),
+            ('EXPIRE', current_key, math.ceil(2 * per_seconds)),
+            ('GET', previous_key)
+        )
+        previous = int(previous or 0)
+        weight = 1 - (now - window_index * per_seconds) / per_seconds
+        if previous * weight + current <= limit:
+            return True, 0.0
+
+        self.client.execute(('DECR', current_key))
+        return False, _retry_after(current - 1, previous, weight, limit, per_seconds)
+
+class RateLimiter:
+    """
+    Sliding window rate limiter over a pluggable counter backend
+
+    Errors from a shared backend are logged and the request is let
+    through, so an unreachable store never takes the site down.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def hit(self, key: str, limit: int, per_seconds: float) -> Tuple[bool, float]:
+        """
+        Count one request for a key
+
+        Args:
+            key: Rate limit key, e.g. route plus user id
+            limit: Maximum requests per window
+            per_seconds: Window length in seconds
+
+        Returns:
+            Tuple of (allowed, retry_after_seconds)
+        """
+        if not self.enabled:
+            return True, 0.0
+
+        try:
+            return self.backend.hit(key, limit, per_seconds)
+        except Exception as e:
+            print(f"Error checking rate limit: {str(e)}")
+            return True, 0.0
+
+def create_rate_limiter() -> RateLimiter:
+    """Create the rate limiter configured by the RATE_LIMIT_* environment variables"""
+    backend_name = os.getenv('RATE_LIMIT_BACKEND', 'sqlite').lower()
+    max_keys = int(os.getenv('RATE_LIMIT_MAX_KEYS', '10000'))
+
+    if backend_name == 'redis':
+        url = os.getenv('RATE_LIMIT_REDIS_URL') or os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+        backend = RedisRateLimitBackend(url)
+    elif backend_name == 'sqlite':
+        path = os.getenv('RATE_LIMIT_PATH') or os.path.join(tempfile.gettempdir(), 'writify_rate_limits.sqlite3')
+        try:
+            backend = SQLiteRateLimitBackend(path, max_keys=max_keys)
+        except Exception as e:
+            print(f"⚠️ Could not open shared rate limit store at {path}: {str(e)}")
+            print("⚠️ Falling back to in-process rate limits")
+            backend = MemoryRateLimitBackend(max_keys=max_keys)
+    elif backend_name == 'memory':
+        backend = MemoryRateLimitBackend(max_keys=max_keys)
+    else:
+        backend = None  # Rate limiting disabled
+
+    return RateLimiter(backend)
+
+# Global instance
+rate_limiter = create_rate_limiter()
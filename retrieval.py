@@ -0,0 +1,304 @@
+import re
+import math
+from collections import Counter
+from typing import Dict, List
+from sqlalchemy import select, insert, func, and_, literal
+from sqlalchemy.orm import aliased
+from models import db, DocumentChunk, document_chunk_terms
+from document_processor import document_processor
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most
+my myself no nor not now of off on once only or other our ours ourselves out over own same she should
+so some such than that the their theirs them themselves then there these they this those through to
+too under until up very was we were what when where which while who whom why will with would you
+your yours yourself yourselves
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase index terms, dropping stopwords and one-letter tokens"""
+    return [
+        token[:64] for token in TOKEN_PATTERN.findall((text or "").lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+class DocumentRetriever:
+    """
+    BM25 retrieval over document chunks
+
+    At upload time a document's text is split into chunks of roughly
+    CHUNK_CHARS characters and every chunk's term frequencies are written
+    to the document_chunk_terms inverted index. At suggestion time only
+    the postings for the query terms are read, scored with BM25, and the
+    best chunks fill the AI context budget.
+    """
+
+    CHUNK_CHARS = 700
+    K1 = 1.2
+    B = 0.75
+
+    def chunk_text(self, text: str) -> List[str]:
+        """
+        Split text into chunks, keeping paragraphs and sentences together where possible
+
+        Args:
+            text: Extracted document text
+
+        Returns:
+            List of chunk strings, each at most CHUNK_CHARS long
+        """
+        pieces = []
+        for paragraph in re.split(r'\n\s*\n|\n', (text or "").strip()):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if len(paragraph) <= self.CHUNK_CHARS:
+                pieces.append(paragraph)
+                continue
+
+            # Long paragraph: split on sentences, then hard-split sentences that are still too long
+            for sentence in SENTENCE_BOUNDARY.split(paragraph):
+                while len(sentence) > self.CHUNK_CHARS:
+                    pieces.append(sentence[:self.CHUNK_CHARS])
+                    sentence = sentence[self.CHUNK_CHARS:]
+                if sentence:
+                    pieces.append(sentence)
+
+        chunks = []
+        current = ""
+        for piece in pieces:
+            if current and len(current) + 1 + len(piece) > self.CHUNK_CHARS:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n{piece}" if current else piece
+        if current:
+            chunks.append(current)
+
+        return chunks
+
+    def index_document(self, document, text: str):
+        """
+        Chunk a document and write its chunks and inverted index rows
+
+        The document must already have an id (flush before calling). The
+        caller commits.
+        """
+        contents = self.chunk_text(text)
+        chunk_terms = [tokenize(content) for content in contents]
+
+        if contents:
+            # Bulk insert the chunks, getting their ids back in parameter order
+            chunk_ids = db.session.execute(
+                insert(DocumentChunk).returning(DocumentChunk.id, sort_by_parameter_order=True),
+                [
+                    {'document_id': document.id, 'position': position, 'content': content, 'length': len(terms)}
+                    for position, (content, terms) in enumerate(zip(contents, chunk_terms))
+                ]
+            ).scalars().all()
+
+            postings = [
+                {'term': term, 'chunk_id': chunk_id, 'document_id': document.id, 'tf': tf}
+                for chunk_id, terms in zip(chunk_ids, chunk_terms)
+                for term, tf in Counter(terms).items()
+            ]
+            if postings:
+                db.session.execute(insert(document_chunk_terms), postings)
+
+        document.chunk_count = len(contents)
+        document.token_count = sum(len(terms) for terms in chunk_terms)
+
+    def copy_index(self, document, source_document_id: int, chunk_count: int, token_count: int):
+        """
+        Give a document the chunks and inverted index rows of another document with the same text
+
+        The rows are copied inside the database, without chunking or
+        tokenizing again. The document must already have an id. The caller
+        commits.
+        """
+        db.session.execute(
+            insert(DocumentChunk).from_select(
+                ['document_id', 'position', 'content', 'length'],
+                select(
+                    literal(document.id), DocumentChunk.position, DocumentChunk.content, DocumentChunk.length
+                ).where(DocumentChunk.document_id == source_document_id)
+            )
+        )
+
+        # Postings follow their chunk by position
+        source_chunk = aliased(DocumentChunk)
+        copied_chunk = aliased(DocumentChunk)
+        db.session.execute(
+            insert(document_chunk_terms).from_select(
+                ['term', 'chunk_id', 'document_id', 'tf'],
+                select(
+                    document_chunk_terms.c.term, copied_chunk.id, literal(document.id), document_chunk_terms.c.tf
+                )
+                .join(source_chunk, source_chunk.id == document_chunk_terms.c.chunk_id)
+                .join(copied_chunk, and_(copied_chunk.document_id == document.id,
+                                         copied_chunk.position == source_chunk.position))
+                .where(document_chunk_terms.c.document_id == source_document_id)
+            )
+        )
+
+        document.chunk_count = chunk_count
+        document.token_count = token_count
+
+    def get_relevant_context(self, documents, title: str, current_text: str, max_length: int = 5000) -> str:
+        """
+        Build AI context from the chunks most relevant to what the user is writing
+
+        The query is the title plus the last paragraph of the current text.
+        Falls back to the head/tail digest context when there is nothing to
+        rank with or some documents are not indexed yet.
+
+        Args:
+            documents: Document model instances associated with the text
+            title: The writing title/topic
+            current_text: Current text being written
+            max_length: Maximum length of combined context
+
+        Returns:
+            Combined text context from the best matching chunks
+        """
+        if not documents:
+            return ""
+
+        paragraphs = [p for p in re.split(r'\n\s*\n', (current_text or "").strip()) if p.strip()]
+        query_terms = set(tokenize(title) + tokenize(paragraphs[-1] if paragraphs else ""))
+
+        if not query_terms or not all(doc.is_indexed for doc in documents):
+            return document_processor.get_document_context(documents, max_length)
+
+        try:
+            ranked = self._rank_chunks(documents, query_terms)
+        except Exception as e:
+            print(f"Error ranking document chunks: {str(e)}")
+            ranked = []
+
+        if not ranked:
+            return document_processor.get_document_context(documents, max_length)
+
+        return self._build_context(documents, ranked, max_length)
+
+    def best_chunk_ids(self, document_ids: List[int], query: str) -> Dict[int, int]:
+        """
+        Pick one chunk per document to show as a search snippet
+
+        The chunk with the most occurrences of the query terms wins; documents
+        where no chunk contains a term (e.g. the match is in the title) get
+        their first chunk.
+
+        Returns:
+            Dictionary of document id to chunk id, for indexed documents
+        """
+        if not document_ids:
+            return {}
+
+        best: Dict[int, int] = {}
+        query_terms = set(tokenize(query))
+        if query_terms:
+            scores = db.session.execute(
+                select(
+                    document_chunk_terms.c.document_id,
+                    document_chunk_terms.c.chunk_id,
+                    func.sum(document_chunk_terms.c.tf).label('score')
+                )
+                .where(document_chunk_terms.c.document_id.in_(document_ids))
+                .where(document_chunk_terms.c.term.in_(query_terms))
+                .group_by(document_chunk_terms.c.document_id, document_chunk_terms.c.chunk_id)
+                .order_by(func.sum(document_chunk_terms.c.tf).desc(), document_chunk_terms.c.chunk_id)
+            ).all()
+            for row in scores:
+                best.setdefault(row.document_id, row.chunk_id)
+
+        missing = [document_id for document_id in document_ids if document_id not in best]
+        if missing:
+            best.update(db.session.execute(
+                select(DocumentChunk.document_id, DocumentChunk.id)
+                .where(DocumentChunk.document_id.in_(missing), DocumentChunk.position == 0)
+            ).tuples().all())
+
+        return best
+
+    def _rank_chunks(self, documents, query_terms) -> List[int]:
+        """Score candidate chunks with BM25, returning chunk ids best first"""
+        document_ids = [doc.id for doc in documents]
+        total_chunks = sum(doc.chunk_count for doc in documents)
+        if not total_chunks:
+            return []
+        avg_length = sum(doc.token_count for doc in documents) / total_chunks or 1.0
+
+        postings = db.session.execute(
+            select(
+                document_chunk_terms.c.chunk_id,
+                document_chunk_terms.c.term,
+                document_chunk_terms.c.tf,
+                DocumentChunk.length
+            )
+            .join(DocumentChunk, DocumentChunk.id == document_chunk_terms.c.chunk_id)
+            .where(document_chunk_terms.c.document_id.in_(document_ids))
+            .where(document_chunk_terms.c.term.in_(query_terms))
+        ).all()
+
+        document_frequency = Counter(row.term for row in postings)
+        scores: Dict[int, float] = {}
+        for row in postings:
+            df = document_frequency[row.term]
+            idf = math.log(1 + (total_chunks - df + 0.5) / (df + 0.5))
+            norm = self.K1 * (1 - self.B + self.B * row.length / avg_length)
+            scores[row.chunk_id] = scores.get(row.chunk_id, 0.0) + idf * row.tf * (self.K1 + 1) / (row.tf + norm)
+
+        return sorted(scores, key=scores.get, reverse=True)
+
+    def _build_context(self, documents, ranked: List[int], max_length: int) -> str:
+        """Fill the context budget with the best chunks, grouped per document in reading order"""
+        # Only fetch as many chunks as could possibly fit
+        candidate_ids = ranked[:max(1, max_length // 100)]
+        chunks = {
+            chunk.id: chunk for chunk in db.session.execute(
+                select(DocumentChunk.id, DocumentChunk.document_id, DocumentChunk.position, DocumentChunk.content)
+                .where(DocumentChunk.id.in_(candidate_ids))
+            ).all()
+        }
+        names = {doc.id: doc.original_filename for doc in documents}
+
+        selected: Dict[int, list] = {}  # document_id -> chunks, in order of the document's best match
+        used = 0
+        for chunk_id in candidate_ids:
+            chunk = chunks.get(chunk_id)
+            if chunk is None:
+                continue
+
+            cost = len(chunk.content) + 1
+            if chunk.document_id not in selected:
+                cost += len(f"\n--- From {names[chunk.document_id]} ---\n")
+            if used + cost > max_length:
+                continue
+
+            selected.setdefault(chunk.document_id, []).append(chunk)
+            used += cost
+
+        combined_text = ""
+        for document_id, doc_chunks in selected.items():
+            combined_text += f"\n--- From {names[document_id]} ---\n"
+            previous_position = None
+            for chunk in sorted(doc_chunks, key=lambda c: c.position):
+                if previous_position is not None and chunk.position != previous_position + 1:
+                    combined_text += "[...]\n"
+                combined_text += chunk.content + "\n"
+                previous_position = chunk.position
+
+        # Truncate to max_length if needed
+        if len(combined_text) > max_length:
+            combined_text = combined_text[:max_length] + "..."
+
+        return combined_text.strip()
+
+# Global instance
+document_retriever = DocumentRetriever()
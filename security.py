@@ -1,37 +1,39 @@
 from functools import wraps
-from flask import request, abort, current_app, session
+from flask import request, abort, current_app, session, jsonify
 from flask_login import current_user
-import time
-from collections import defaultdict
+from werkzeug.exceptions import TooManyRequests
 from datetime import datetime, timedelta
+import math
 import re
-
-# Rate limiting storage (in production, use Redis)
-rate_limit_storage = defaultdict(list)
+from rate_limiter import rate_limiter
 
 def rate_limit(max_requests=5, per_seconds=60, key_func=None):
     """
-    Rate limiting decorator
+    Rate limiting decorator (sliding window, see rate_limiter.py)
+    
+    Requests are counted per route and per user, or per IP address for
+    anonymous requests, unless key_func provides the key.
     """
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if key_func:
-                key = key_func()
+                identity = key_func()
+            elif current_user.is_authenticated:
+                identity = f"user:{current_user.id}"
             else:
-                key = request.remote_addr
-                
-            now = time.time()
-            # Clean old requests
-            rate_limit_storage[key] = [
-                req_time for req_time in rate_limit_storage[key] 
-                if now - req_time < per_seconds
-            ]
+                identity = f"ip:{request.remote_addr}"
+            
+            allowed, retry_after = rate_limiter.hit(f"{request.endpoint}:{identity}", max_requests, per_seconds)
+            if not allowed:
+                retry_after = max(1, math.ceil(retry_after))
+                if request.path.startswith('/api/'):
+                    response = jsonify({'error': 'Too many requests, please try again later', 'retry_after': retry_after})
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response
+                raise TooManyRequests(retry_after=retry_after)
             
-            if len(rate_limit_storage[key]) >= max_requests:
-                abort(429)  # Too Many Requests
-                
-            rate_limit_storage[key].append(now)
             return f(*args, **kwargs)
         return decorated_function
     return decorator
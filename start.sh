@@ -2,20 +2,24 @@
 
 echo "🚀 Starting Writify deployment..."
 
-# Create database tables
-echo "📊 Creating database tables..."
-python create_tables.py
-
-# Run database migrations (fallback)
+# Run database migrations first, so they create and backfill their own tables
 echo "📋 Running database migrations..."
 python run_migrations.py || echo "⚠️ Migrations failed or not needed"
 
+# Create any tables the migrations do not cover (fallback)
+echo "📊 Creating database tables..."
+python create_tables.py
+
 # Initialize database with admin user
 echo "👤 Initializing database..."
 python init_database.py || echo "⚠️ Database already initialized"
 
+# Catch up on periodic maintenance (also schedule this, e.g. every 15 minutes)
+echo "🧹 Running maintenance jobs..."
+python maintenance.py expire-trials sweep-tokens sweep-payment-events || echo "⚠️ Maintenance jobs failed"
+
 echo "✅ Database setup complete!"
 
 # Start the application
 echo "🌐 Starting web application..."
-exec gunicorn -w 4 -b 0.0.0.0:$PORT run:app
\ No newline at end of file
+exec gunicorn -w 4 -k gthread --threads 8 -b 0.0.0.0:$PORT run:app
\ No newline at end of file
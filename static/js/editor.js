@@ -15,6 +15,8 @@ class ModernAIEditor {
         this.debounceTimer = null;
         this.debounceDelay = 1500;
         this.currentRequestId = 0;
+        this.clientId = this.generateClientId();  // Keeps other tabs' requests on the same text apart
+        this.inFlightRequest = null;
         this.currentSuggestion = null;
         this.suggestionElement = null;
         this.originalRange = null;
@@ -81,6 +83,9 @@ class ModernAIEditor {
         // Clear current suggestion when user types
         this.clearSuggestion();
         
+        // Any in-flight request is now stale - stop it on the server too
+        this.abortInFlightRequest();
+        
         // Only make AI request if title is provided
         if (!this.titleInput.value.trim()) {
             return;
@@ -190,6 +195,15 @@ class ModernAIEditor {
         }, this.debounceDelay);
     }
     
+    generateClientId() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        // randomUUID is only available in secure contexts
+        const bytes = crypto.getRandomValues(new Uint8Array(16));
+        return Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+    }
+    
     async makeAIRequest() {
         const title = this.titleInput.value.trim();
         const text = this.getTextContent().trim();
@@ -198,8 +212,17 @@ class ModernAIEditor {
             return;
         }
         
+        // A new request supersedes the previous one
+        this.abortInFlightRequest();
+        
         // Generate unique request ID
         const requestId = ++this.currentRequestId;
+        const controller = new AbortController();
+        this.inFlightRequest = {
+            id: requestId,
+            textId: window.currentActiveTextId || null,
+            controller: controller
+        };
         
         try {
             const response = await fetch('/api/ai-assist', {
@@ -210,10 +233,21 @@ class ModernAIEditor {
                 body: JSON.stringify({
                     title: title,
                     text: text,
-                    current_text_id: window.currentActiveTextId || null
-                })
+                    current_text_id: window.currentActiveTextId || null,
+                    client_id: this.clientId,
+                    request_id: requestId,
+                    stream: true
+                }),
+                signal: controller.signal
             });
             
+            // Streamed responses deliver suggestions one by one as Server-Sent Events
+            const contentType = response.headers.get('Content-Type') || '';
+            if (response.ok && contentType.includes('text/event-stream')) {
+                await this.readSuggestionStream(response, requestId);
+                return;
+            }
+            
             const result = await response.json();
             
             // Check if this is still the latest request
@@ -235,11 +269,103 @@ class ModernAIEditor {
             }
             
         } catch (error) {
-            if (requestId !== this.currentRequestId) {
+            if (requestId !== this.currentRequestId || error.name === 'AbortError') {
                 return;
             }
             
             console.error('AI request error:', error);
+        } finally {
+            if (this.inFlightRequest && this.inFlightRequest.id === requestId) {
+                this.inFlightRequest = null;
+            }
+        }
+    }
+    
+    abortInFlightRequest() {
+        if (!this.inFlightRequest) {
+            return;
+        }
+        
+        const { id, textId, controller } = this.inFlightRequest;
+        this.inFlightRequest = null;
+        
+        // Stop reading the response and tell the server to cancel the upstream call
+        controller.abort();
+        fetch('/api/ai-assist/abort', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                current_text_id: textId,
+                client_id: this.clientId,
+                request_id: id
+            }),
+            keepalive: true
+        }).catch(() => {});
+    }
+    
+    async readSuggestionStream(response, requestId) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let firstSuggestion = null;
+        let shown = false;
+        
+        const handleEvent = (rawEvent) => {
+            let eventName = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            
+            if (eventName !== 'suggestion' || !data) {
+                return;
+            }
+            
+            const suggestion = JSON.parse(data);
+            if (suggestion.type === 'error') {
+                return;
+            }
+            if (!firstSuggestion) {
+                firstSuggestion = suggestion;
+            }
+            
+            // Show a continuation as soon as it arrives instead of waiting for the others
+            if (!shown && suggestion.type === 'continuation') {
+                shown = true;
+                this.showInlineSuggestion(suggestion.text);
+            }
+        };
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            
+            // Stop reading if a newer request has been made
+            if (requestId !== this.currentRequestId) {
+                reader.cancel();
+                return;
+            }
+            
+            if (done) {
+                break;
+            }
+            
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                handleEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+            }
+        }
+        
+        // No continuation was streamed - fall back to the first suggestion
+        if (!shown && firstSuggestion) {
+            this.showInlineSuggestion(firstSuggestion.text);
         }
     }
     
@@ -1,10 +1,19 @@
 import os
+import zlib
 import stripe
 from datetime import datetime, timedelta
 from flask import current_app, url_for
 from models import db, User, Subscription, PaymentEvent
 
 class StripeService:
+    # Fields of each event's object that the webhook handlers use, kept in PaymentEvent.summary
+    EVENT_SUMMARY_FIELDS = {
+        'checkout.session.completed': ('customer', 'subscription', 'metadata'),
+        'customer.subscription.updated': ('customer', 'status', 'current_period_start', 'current_period_end', 'canceled_at'),
+        'customer.subscription.deleted': ('customer', 'status', 'current_period_start', 'current_period_end', 'canceled_at'),
+        'invoice.payment_failed': ('customer', 'subscription')
+    }
+    
     def __init__(self):
         self.stripe_key = os.getenv('STRIPE_SECRET_KEY')
         
@@ -18,6 +27,9 @@ class StripeService:
         # Price IDs - these should be configured in Stripe Dashboard
         self.MONTHLY_PRICE_ID = os.getenv('STRIPE_MONTHLY_PRICE_ID', 'price_monthly_27')
         self.ANNUAL_PRICE_ID = os.getenv('STRIPE_ANNUAL_PRICE_ID', 'price_annual_192')
+        
+        # Keep a compressed copy of each webhook body (cleared by maintenance.py after PAYMENT_EVENT_PAYLOAD_DAYS)
+        self.store_event_payloads = os.getenv('PAYMENT_EVENT_STORE_PAYLOAD', 'true').lower() == 'true'
     
     def _ensure_stripe_configured(self):
         """Ensure Stripe is properly configured"""
@@ -312,6 +324,34 @@ class StripeService:
             else:
                 current_app.logger.error(f"Webhook error: {str(e)}")
                 raise Exception(f"Webhook error: {str(e)}")
+    
+    def build_payment_event(self, event, payload):
+        """
+        Create the PaymentEvent record of a webhook event
+        
+        Only the object's id and the fields the handlers use are stored,
+        plus the raw body compressed if payload storage is enabled.
+        
+        Args:
+            event: Verified Stripe event
+            payload: Raw webhook request body (bytes)
+        
+        Returns:
+            PaymentEvent model instance (not added to the session)
+        """
+        event_object = event['data']['object']
+        summary = {}
+        for field in self.EVENT_SUMMARY_FIELDS.get(event['type'], ()):
+            value = event_object.get(field)
+            summary[field] = dict(value) if isinstance(value, dict) else value
+        
+        return PaymentEvent(
+            stripe_event_id=event['id'],
+            event_type=event['type'],
+            object_id=event_object.get('id'),
+            summary=summary,
+            payload=zlib.compress(payload, 6) if self.store_event_payloads else None
+        )
 
 # Global service instance
 stripe_service = StripeService()
\ No newline at end of file
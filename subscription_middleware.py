@@ -1,7 +1,10 @@
 from functools import wraps
-from flask import request, redirect, url_for, jsonify, flash
+from flask import redirect, url_for, jsonify, flash
 from flask_login import current_user
 from datetime import datetime
+from sqlalchemy import update, func, case, or_
+from sqlalchemy.dialects.postgresql import insert
+from models import db, UserUsage
 
 def subscription_required(f):
     """Decorator to require active subscription or trial"""
@@ -38,7 +41,7 @@ def api_subscription_required(f):
             return jsonify({
                 'error': 'Subscription required',
                 'subscription_status': current_user.subscription_status,
-                'trial_expired': current_user.subscription_status == 'trial' and not current_user.is_trial_active,
+                'trial_expired': current_user.subscription_status in ['trial', 'trial_expired'] and not current_user.is_trial_active,
                 'redirect_url': url_for('billing.pricing')
             }), 403
         
@@ -46,18 +49,6 @@ def api_subscription_required(f):
     
     return decorated_function
 
-def check_trial_status():
-    """Check and update trial status for authenticated users"""
-    if current_user.is_authenticated:
-        # Auto-expire trial if time is up
-        if (current_user.subscription_status == 'trial' and 
-            current_user.trial_ends_at and 
-            current_user.trial_ends_at < datetime.utcnow()):
-            
-            current_user.subscription_status = 'trial_expired'
-            from models import db
-            db.session.commit()
-
 def get_subscription_context():
     """Get subscription context for templates"""
     if not current_user.is_authenticated:
@@ -91,19 +82,13 @@ def get_subscription_context():
     return context
 
 def init_subscription_middleware(app):
-    """Initialize subscription middleware with Flask app"""
-    
-    @app.before_request
-    def before_request():
-        # Skip for auth routes, static files, and webhooks
-        if (request.endpoint and 
-            (request.endpoint.startswith('auth.') or 
-             request.endpoint.startswith('static') or
-             request.endpoint == 'billing.webhook')):
-            return
-        
-        # Check trial status
-        check_trial_status()
+    """
+    Initialize subscription middleware with Flask app
+    
+    Requests never write subscription state: an ended trial is detected
+    from trial_ends_at (User.is_trial_active), and the status column is
+    flipped in bulk by `python maintenance.py expire-trials`.
+    """
     
     @app.context_processor
     def inject_subscription_context():
@@ -136,11 +121,94 @@ class UsageLimits:
     @staticmethod
     def can_create_text(user):
         """Check if user can create more texts"""
-        current_count = user.texts.count()
-        return current_count < UsageLimits.get_text_limit(user)
+        return UsageLimits._current(user, UserUsage.text_count) < UsageLimits.get_text_limit(user)
     
     @staticmethod
     def can_upload_document(user):
         """Check if user can upload more documents"""
-        current_count = user.documents.count()
-        return current_count < UsageLimits.get_document_limit(user)
\ No newline at end of file
+        return UsageLimits._current(user, UserUsage.document_count) < UsageLimits.get_document_limit(user)
+    
+    # Counters are changed in the caller's transaction, together with the write they count,
+    # so a rolled back write never leaves a counted text/document behind (the caller commits)
+    
+    @staticmethod
+    def reserve_text(user):
+        """Count one more text if the user is under the limit; False if the limit is reached"""
+        return UsageLimits._increment(user, UserUsage.text_count, UsageLimits.get_text_limit(user))
+    
+    @staticmethod
+    def release_text(user):
+        """Stop counting a deleted text"""
+        UsageLimits._decrement(user, UserUsage.text_count)
+    
+    @staticmethod
+    def reserve_document(user):
+        """Count one more document if the user is under the limit; False if the limit is reached"""
+        return UsageLimits._increment(user, UserUsage.document_count, UsageLimits.get_document_limit(user))
+    
+    @staticmethod
+    def release_document(user):
+        """Stop counting a deleted document"""
+        UsageLimits._decrement(user, UserUsage.document_count)
+    
+    @staticmethod
+    def reserve_ai_request(user):
+        """Count one AI request for today (UTC) if the daily limit allows it; False if it does not"""
+        now = datetime.utcnow()
+        today = now.date()
+        statement = insert(UserUsage).values(
+            user_id=user.id, ai_request_date=today, ai_request_count=1, updated_at=now
+        ).on_conflict_do_update(
+            index_elements=[UserUsage.user_id],
+            set_={
+                # A new day starts the count again
+                'ai_request_count': case(
+                    (UserUsage.ai_request_date == today, UserUsage.ai_request_count + 1),
+                    else_=1
+                ),
+                'ai_request_date': today,
+                'updated_at': now
+            },
+            where=or_(
+                UserUsage.ai_request_date.is_distinct_from(today),
+                UserUsage.ai_request_count < UsageLimits.get_ai_requests_limit(user)
+            )
+        ).returning(UserUsage.ai_request_count)
+        return db.session.execute(statement).scalar() is not None
+    
+    @staticmethod
+    def release_ai_request(user):
+        """Give back one of today's AI requests (e.g. one answered from the cache)"""
+        now = datetime.utcnow()
+        db.session.execute(
+            update(UserUsage)
+            .where(UserUsage.user_id == user.id, UserUsage.ai_request_date == now.date())
+            .values(ai_request_count=func.greatest(UserUsage.ai_request_count - 1, 0), updated_at=now)
+        )
+    
+    @staticmethod
+    def _current(user, counter):
+        return db.session.execute(
+            db.select(counter).where(UserUsage.user_id == user.id)
+        ).scalar() or 0
+    
+    @staticmethod
+    def _increment(user, counter, limit):
+        """Atomic check-and-increment: one upsert whose update only applies under the limit"""
+        now = datetime.utcnow()
+        statement = insert(UserUsage).values(
+            {'user_id': user.id, counter.key: 1, 'updated_at': now}
+        ).on_conflict_do_update(
+            index_elements=[UserUsage.user_id],
+            set_={counter.key: counter + 1, 'updated_at': now},
+            where=counter < limit
+        ).returning(counter)
+        return db.session.execute(statement).scalar() is not None
+    
+    @staticmethod
+    def _decrement(user, counter):
+        db.session.execute(
+            update(UserUsage)
+            .where(UserUsage.user_id == user.id)
+            .values({counter.key: func.greatest(counter - 1, 0), 'updated_at': datetime.utcnow()})
+        )
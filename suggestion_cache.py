@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from contextlib import closing
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class MemoryCacheBackend:
+    """In-process LRU cache with per-entry expiry, bounded by entry count and total bytes"""
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 5 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, size, value = entry
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+
+            # Mark as most recently used
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.time() + ttl, size, value)
+            self._total_bytes += size
+
+            # Evict least recently used entries until we are back within bounds
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+class SQLiteCacheBackend:
+    """
+    Cache stored in a local SQLite file, shared by every worker process on the host
+
+    Entries are evicted least-recently-used first once the entry count or
+    total size bound is exceeded.
+    """
+
+    def __init__(self, path: str, max_entries: int = 1000, max_bytes: int = 5 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS suggestion_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_suggestion_cache_accessed_at ON suggestion_cache (accessed_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM suggestion_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, expires_at = row
+            if expires_at <= now:
+                conn.execute("DELETE FROM suggestion_cache WHERE key = ?", (key,))
+                return None
+
+            conn.execute("UPDATE suggestion_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        size = len(key) + len(value)
+        if size > self.max_bytes:
+            return
+
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO suggestion_cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now + ttl, now)
+            )
+            conn.execute("DELETE FROM suggestion_cache WHERE expires_at <= ?", (now,))
+
+            count, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM suggestion_cache"
+            ).fetchone()
+
+            # Evict least recently used entries until we are back within bounds
+            while count > self.max_entries or total_bytes > self.max_bytes:
+                oldest = conn.execute(
+                    "SELECT key, size FROM suggestion_cache ORDER BY accessed_at LIMIT 1"
+                ).fetchone()
+                if oldest is None:
+                    break
+                conn.execute("DELETE FROM suggestion_cache WHERE key = ?", (oldest[0],))
+                count -= 1
+                total_bytes -= oldest[1]
+                self.evictions += 1
+
+class SuggestionCache:
+    """
+    Cache of parsed AI suggestions keyed on the normalized prompt inputs
+
+    The key is a SHA-256 hash of the title, the current text and a
+    fingerprint of the document context, so identical requests skip the
+    Anthropic round-trip entirely.
+    """
+
+    # Bump when the prompt changes so stale suggestions are not served
+    KEY_VERSION = 'v2'
+
+    def __init__(self, backend=None, ttl: float = 300):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def make_key(self, title: str, current_text: str, document_context: str = "") -> str:
+        """Build the cache key from whitespace-normalized prompt inputs"""
+        normalized_title = ' '.join(title.split())
+        normalized_text = current_text.replace('\r\n', '\n').strip()
+        context_fingerprint = hashlib.sha256(document_context.strip().encode('utf-8')).hexdigest()
+
+        digest = hashlib.sha256()
+        for part in (self.KEY_VERSION, normalized_title, normalized_text, context_fingerprint):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        if not self.enabled:
+            return None
+
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"Error reading suggestion cache: {str(e)}")
+            value = None
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, suggestions: List[Dict]):
+        """Store suggestions unless they are an error response"""
+        if not self.enabled or not suggestions:
+            return
+        if any(suggestion.get('type') == 'error' for suggestion in suggestions):
+            return
+
+        try:
+            self.backend.set(key, json.dumps(suggestions), self.ttl)
+        except Exception as e:
+            print(f"Error writing suggestion cache: {str(e)}")
+
+    def stats(self) -> Dict:
+        """Get hit/miss counters for this process"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__ if self.backend else None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': getattr(self.backend, 'evictions', 0)
+            }
+
+def create_suggestion_cache() -> SuggestionCache:
+    """Create the suggestion cache configured by the AI_CACHE_* environment variables"""
+    backend_name = os.getenv('AI_CACHE_BACKEND', 'memory').lower()
+    ttl = float(os.getenv('AI_CACHE_TTL', '300'))
+    max_entries = int(os.getenv('AI_CACHE_MAX_ENTRIES', '1000'))
+    max_bytes = int(os.getenv('AI_CACHE_MAX_BYTES', str(5 * 1024 * 1024)))
+
+    if backend_name == 'sqlite':
+        path = os.getenv('AI_CACHE_PATH') or os.path.join(tempfile.gettempdir(), 'writify_suggestion_cache.sqlite3')
+        try:
+            backend = SQLiteCacheBackend(path, max_entries=max_entries, max_bytes=max_bytes)
+        except Exception as e:
+            print(f"⚠️ Could not open shared suggestion cache at {path}: {str(e)}")
+            print("⚠️ Falling back to in-process suggestion cache")
+            backend = MemoryCacheBackend(max_entries=max_entries, max_bytes=max_bytes)
+    elif backend_name == 'memory':
+        backend = MemoryCacheBackend(max_entries=max_entries, max_bytes=max_bytes)
+    else:
+        backend = None  # Caching disabled
+
+    return SuggestionCache(backend, ttl=ttl)
+
+# Global instance
+suggestion_cache = create_suggestion_cache()
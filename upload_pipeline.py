@@ -0,0 +1,313 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select, update, delete, or_
+from dotenv import load_dotenv
+from models import db, Document, StagedUpload
+from document_processor import document_processor
+from retrieval import document_retriever
+from blob_store import blob_store
+from content_store import content_store
+
+load_dotenv()
+
+class UploadPipeline:
+    """
+    Background processing for accepted uploads
+
+    The upload request only saves the bytes and creates a Document in the
+    'processing' state; text extraction, storage (Cloudinary or local) and
+    indexing run here (for content that was uploaded before, extraction and
+    storage are skipped and the stored text and index are copied inside the
+    database). The heavy extraction itself runs in the extraction
+    process pool.
+
+    The job lives on the Document row, not in the worker process: its input
+    is the staged upload (the bytes of a small upload in staged_uploads, or
+    the temp file of a large one), and worker threads in every process claim
+    queued documents by setting claimed_at (FOR UPDATE SKIP LOCKED). A job claimed
+    longer than stale_after seconds ago is taken as abandoned, e.g. by a
+    restart, and claimed again; after max_attempts claims it fails.
+    stale_after must therefore be longer than any job takes to run.
+    """
+
+    INTERRUPTED_MESSAGE = 'Processing was interrupted. Please upload the file again.'
+
+    def __init__(self, max_workers: int = 2, stale_after: float = 600, max_attempts: int = 3,
+                 poll_interval: float = 5):
+        self.max_workers = max_workers
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Start the worker threads of each serving process on its first request"""
+
+        @app.before_request
+        def start_upload_pipeline():
+            self.start(app)
+
+    def start(self, app):
+        """
+        Start this process's worker threads, once per process (threads do not survive a fork)
+
+        Args:
+            app: Flask application, used to open an app context in the workers
+        """
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._wake = threading.Event()
+            for index in range(self.max_workers):
+                threading.Thread(
+                    target=self._work,
+                    args=(app,),
+                    name=f'upload-pipeline-{index}',
+                    daemon=True
+                ).start()
+            self._pid = os.getpid()
+
+    def submit(self, app):
+        """
+        Wake the workers for a newly queued upload
+
+        The job itself is the committed Document in the 'processing' state;
+        any worker process may pick it up.
+
+        Args:
+            app: Flask application, used to open an app context in the workers
+        """
+        self.start(app)
+        self._wake.set()
+
+    def _work(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    claimed = self._run_next()
+            except Exception as e:
+                print(f"Error claiming upload job: {str(e)}")
+                claimed = False
+
+            if not claimed:
+                # Nothing queued: sleep until an upload arrives here or the next poll
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _run_next(self) -> bool:
+        """Claim and process one queued upload; False if there was none"""
+        try:
+            job = self._claim()
+            if job is None:
+                return False
+
+            document_id, claimed_at, attempts = job
+            try:
+                if attempts > self.max_attempts:
+                    self._mark_failed(document_id, self.INTERRUPTED_MESSAGE, claimed_at)
+                else:
+                    self._process(document_id, claimed_at)
+            except Exception as e:
+                print(f"Error in upload pipeline for document {document_id}: {str(e)}")
+                db.session.rollback()
+                self._mark_failed(document_id, 'Error processing file. Please try again.', claimed_at)
+            return True
+        finally:
+            db.session.remove()
+
+    def _claim(self) -> Optional[tuple]:
+        """
+        Take the oldest queued or abandoned job
+
+        Returns:
+            Tuple of (document_id, claimed_at, attempts), or None if there is no job
+        """
+        now = datetime.utcnow()
+        next_job = (
+            select(Document.id)
+            .where(
+                Document.status == 'processing',
+                or_(Document.claimed_at.is_(None),
+                    Document.claimed_at < now - timedelta(seconds=self.stale_after))
+            )
+            .order_by(Document.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        job = db.session.execute(
+            update(Document)
+            .where(Document.id == next_job)
+            .values(claimed_at=now, attempts=Document.attempts + 1)
+            .returning(Document.id, Document.attempts)
+            .execution_options(synchronize_session=False)
+        ).first()
+        db.session.commit()
+
+        if job is None:
+            return None
+        return job[0], now, job[1]
+
+    def _process(self, document_id: int, claimed_at: datetime):
+        document = db.session.get(Document, document_id)
+        if document is None or document.claimed_at != claimed_at:
+            return
+
+        upload = self._load_upload(document)
+        db.session.commit()  # Hold no transaction open during extraction
+        if upload is None:
+            self._mark_failed(document_id, self.INTERRUPTED_MESSAGE, claimed_at)
+            return
+
+        # Same bytes uploaded before: skip parsing and storage entirely
+        result = self._reuse_existing(upload)
+        if result is None:
+            # End the lookup's transaction, so no connection idles in it through extraction and storage
+            db.session.rollback()
+            result = document_processor.process_saved_file(upload)
+
+        document = db.session.get(Document, document_id, with_for_update=True, populate_existing=True)
+        if document is None or document.claimed_at != claimed_at:
+            # Deleted while it was processing, or claimed again by another worker:
+            # drop whatever was stored or referenced
+            if 'blob_id' in result:
+                db.session.rollback()
+            elif 'error' not in result:
+                self._delete_stored_file(result)
+            return
+
+        self._clear_staging(document)
+
+        if 'error' in result:
+            document.status = 'failed'
+            document.error_message = result['error']
+            db.session.commit()
+            return
+
+        if 'source_document_id' in result:
+            # Same text as a sibling: copy its stored text and index inside the database
+            content_store.copy(document, result['source_document_id'])
+            document_retriever.copy_index(
+                document, result['source_document_id'], result['chunk_count'], result['token_count']
+            )
+        else:
+            content_store.save(document, result['extracted_text'])
+            # Chunk and index the text for relevance-ranked AI context
+            document_retriever.index_document(document, result['extracted_text'])
+
+        document.context_head = result['context_digest']['context_head']
+        document.context_tail = result['context_digest']['context_tail']
+        document.content_length = result['context_digest']['content_length']
+        document.upload_path = result.get('file_path')  # May be None for Cloudinary uploads
+        document.cloudinary_public_id = result.get('cloudinary_public_id')
+        document.cloudinary_url = result.get('cloudinary_url')
+        document.cloudinary_secure_url = result.get('cloudinary_secure_url')
+        document.blob_id = result.get('blob_id') or self._register_blob(upload, result)
+
+        document.status = 'ready'
+        document.error_message = None
+        db.session.commit()
+
+    def _load_upload(self, document) -> Optional[dict]:
+        """Rebuild the save_upload dictionary of a queued document; None if its staged upload is gone"""
+        data = None
+        if document.staged_path is None:
+            staged = db.session.get(StagedUpload, document.id)
+            if staged is None:
+                return None
+            data = staged.data
+        elif not os.path.exists(document.staged_path):
+            return None  # Temp files do not survive a redeploy to a fresh disk
+
+        return {
+            'user_id': document.user_id,
+            'filename': document.filename,
+            'original_filename': document.original_filename,
+            'file_type': document.file_type,
+            'file_size': document.file_size,
+            'sha256': document.upload_sha256,
+            'temp_path': document.staged_path,
+            'data': data
+        }
+
+    def _clear_staging(self, document):
+        """Drop the staged upload of a document whose job is finished"""
+        if document.staged_path:
+            document_processor.discard_upload({'temp_path': document.staged_path})
+        document.staged_path = None
+        db.session.execute(delete(StagedUpload).where(StagedUpload.document_id == document.id))
+
+    def _reuse_existing(self, upload: dict):
+        """Reference the stored copy and extracted text of an identical earlier upload, if any"""
+        if not upload.get('sha256'):
+            return None
+
+        reusable = blob_store.find_reusable(upload['sha256'])
+        if reusable is None or not blob_store.acquire(reusable['blob_id']):
+            return None
+
+        document_processor.discard_upload(upload)
+        return reusable
+
+    def _register_blob(self, upload: dict, result: dict):
+        """Record a fresh upload for deduplication; None leaves the document owning its file"""
+        if not upload.get('sha256'):
+            return None
+        return blob_store.register(upload['sha256'], upload, result)
+
+    def _mark_failed(self, document_id: int, message: str, claimed_at: datetime):
+        try:
+            document = db.session.get(Document, document_id, with_for_update=True, populate_existing=True)
+            if document is not None and document.claimed_at == claimed_at:
+                document.status = 'failed'
+                document.error_message = message
+                self._clear_staging(document)
+            db.session.commit()
+        except Exception as e:
+            print(f"Error marking document {document_id} as failed: {str(e)}")
+            db.session.rollback()
+
+    def _delete_stored_file(self, result: dict):
+        document_processor.delete_stored_file(result.get('cloudinary_public_id'), result.get('file_path'))
+
+    def check_stale(self, document) -> bool:
+        """
+        Mark a document failed if its job was abandoned on its last attempt
+
+        Staleness counts from when a worker claimed the job, so a document
+        that is only queued is never failed here.
+
+        Args:
+            document: Document model instance in the 'processing' state
+
+        Returns:
+            True if the document was marked failed (the caller commits)
+        """
+        if document.status != 'processing' or document.claimed_at is None:
+            return False
+
+        if document.attempts < self.max_attempts:
+            return False  # A worker will claim it again
+
+        if datetime.utcnow() - document.claimed_at < timedelta(seconds=self.stale_after):
+            return False
+
+        document.status = 'failed'
+        document.error_message = self.INTERRUPTED_MESSAGE
+        self._clear_staging(document)
+        return True
+
+# Global instance
+upload_pipeline = UploadPipeline(
+    max_workers=int(os.getenv('UPLOAD_WORKERS', '2')),
+    stale_after=float(os.getenv('UPLOAD_STALE_AFTER', '600')),
+    max_attempts=int(os.getenv('UPLOAD_MAX_ATTEMPTS', '3')),
+    poll_interval=float(os.getenv('UPLOAD_POLL_INTERVAL', '5'))
+)